@@ -1,10 +1,28 @@
 #!/usr/bin/env python
-import xml.etree.ElementTree as ET
+import json
+import time
 from ncclient import manager
 import acitoolkit.acitoolkit as aci
-from acitoolkit import Node
+from acimigrate.inventory import FabricInventory, physif_from_attributes, switch_from_attributes
+from acimigrate.nxconfig import ConfigBuilder
+from acimigrate.vlans import range_strings, range_token, vlan_ranges
+from acimigrate.query import iter_class, iter_mo, attributes
+from acimigrate.sessions import netconf_pool, credential_key, apic_sessions
+from acimigrate.snapshot import Snapshot, snapshot_property
+from acimigrate.model import DiscoveryModel
+from acimigrate.scheduler import PushError, PushScheduler, SCHEDULER_WORKERS, with_retry
+from acimigrate.nxparse import (VLAN_TABLE, PC_TABLE, VPC_TABLE, INTERFACE_TABLE,
+                                SVI_TABLE, HSRP_TABLE, CDP_TABLE)
 
 VLAN_POOL_NAME = 'acimigrate-vlan-pool'
+# Upper bounds for a single tenant POST when batching EPG creation
+APIC_BATCH_SIZE = 250
+APIC_BATCH_MAX_BYTES = 2 * 1024 * 1024
+# Access policies created for the migration vpc
+CDP_POLICY_NAME = 'acimigrate-cdp-policy'
+LACP_POLICY_NAME = 'acimigrate-lacp-policy'
+LINK_POLICY_NAME = 'aci-migrate-link-policy'
+AEP_NAME = 'acimigrate-aep'
 
 
 class APIC(object):
@@ -12,18 +30,23 @@ class APIC(object):
     ACI Utilities used for migrating to ACI fabric
     """
 
-    def __init__(self, url, username, password):
+    def __init__(self, url, username, password, session=None):
         self.url = url
         self.username = username
         self.password = password
-        self.session = aci.Session(self.url, self.username, self.password, verify_ssl=False)
-        self.session.login()
+        # logged in sessions are shared across requests, a session can also
+        # be handed in e.g. the recording session used by plan mode
+        if session is None:
+            session = apic_sessions.get(self.url, self.username, self.password, verify_ssl=False)
+        self.session = session
         self.tenant = None
         self.app = None
         self.physdom = None
         self.context = None
         self.contract = None
-        self.fabric_interfaces = aci.Interface.get(self.session)
+        # leaf interfaces are read on first use, not at login
+        self.inventory = FabricInventory(loader=self._load_node_interfaces)
+        self.leaf_nodes = {}
         self.apic_migration_dict = None
         self.migration_vpc_dn = None
         self.prot_path_dn = None
@@ -31,27 +54,53 @@ class APIC(object):
         self.migration_leaves = []
         self.migration_vpc_rn = None
 
-    def migration_vlan_pool(self, vlans=None):
+    def existing_pool_vlans(self):
+        """
+        Reads the encap blocks of the migration vlan pool from the APIC
+        :return: set of int vlan ids already in the pool
+        """
+        pool_dn = "uni/infra/vlanns-[{}]-static".format(VLAN_POOL_NAME)
+        vlans = set()
+        for mo in iter_mo(self.session, pool_dn,
+                          query_target='children',
+                          target_subtree_class='fvnsEncapBlk'):
+            blk = attributes(mo)
+            first = int(blk['from'].split('-')[1])
+            last = int(blk['to'].split('-')[1])
+            vlans.update(range(first, last + 1))
+        return vlans
+
+    def migration_vlan_pool(self, vlans=None, incremental=False):
         """
         "Creates a VLAN pool based on a list of vlans"
+        Contiguous vlans share a single encap block.
         :param vlans:
+        :param incremental: bool only add the ranges missing from the existing pool
         :return:
         """
         print "creating vlan pool for list {}".format(vlans)
+        pool_dn = "uni/infra/vlanns-[{}]-static".format(VLAN_POOL_NAME)
+
+        if incremental:
+            missing = set(int(v) for v in vlans) - self.existing_pool_vlans()
+            if not missing:
+                print "vlan pool already contains every vlan"
+                return pool_dn
+            vlans = missing
 
         # Initialize a list of fvnsEncapBlk
         children = []
 
-        # construct an encap block for each VLAN
-        for v in vlans:
+        # construct an encap block for each contiguous range of VLANs
+        for first, last in vlan_ranges(vlans):
             obj = {"fvnsEncapBlk": {
                 "attributes":
                     {"allocMode": "inherit",
                      "descr": "",
-                     "from": "vlan-{0}".format(v),
-                     "name": "vlan-{0}".format(v),
+                     "from": "vlan-{0}".format(first),
+                     "name": "vlan-{0}".format(range_token(first, last)),
                      "nameAlias": "",
-                     "to": "vlan-{}".format(v)}}}
+                     "to": "vlan-{}".format(last)}}}
             children.append(obj)
 
         # construct vlan pool
@@ -59,14 +108,14 @@ class APIC(object):
                    {"attributes":
                         {"allocMode": "static",
                          "descr": "",
-                         "dn": "uni/infra/vlanns-[{}]-static".format(VLAN_POOL_NAME),
+                         "dn": pool_dn,
                          "name": "{}".format(VLAN_POOL_NAME),
                          }, "children": children
                     }
                }
 
         # commit vlan pool to APIC
-        resp = self.session.push_to_apic('/api/mo/uni/infra.json', obj)
+        resp = self._push('/api/mo/uni/infra.json', obj)
 
         # return the dn of the object
         return obj['fvnsVlanInstP']['attributes']['dn']
@@ -78,10 +127,13 @@ class APIC(object):
         :return: node_id
 
         """
-        resp = self.session.get('/api/node/class/fabricNode.json?'
-                                'query-target-filter=and(eq(fabricNode.name,"{}"))'.format(name))
-
-        return resp.json()['imdata'][0]['fabricNode']['attributes']['id']
+        nodes = iter_class(self.session, 'fabricNode',
+                           query_filter='and(eq(fabricNode.name,"{}"))'.format(name),
+                           rsp_prop_include='naming-only')
+        node = next(nodes, None)
+        if node is None:
+            raise ValueError('No fabric node named {}'.format(name))
+        return attributes(node)['id']
 
     def create_node_profile(self, switchname, selector):
         """
@@ -92,7 +144,8 @@ class APIC(object):
         """
         node_id = self.node_id_from_name(switchname)
 
-        self.migration_leaves.append(node_id)
+        if node_id not in self.migration_leaves:
+            self.migration_leaves.append(node_id)
         node_prof_json = {"infraNodeP":
                               {"attributes":
                                    {"dn": "uni/infra/nprof-{}".format(switchname),
@@ -123,7 +176,7 @@ class APIC(object):
                                ]
                                }
                           }
-        resp = self.session.push_to_apic('/api/mo/uni/infra.json', node_prof_json)
+        resp = self._push('/api/mo/uni/infra.json', node_prof_json)
         print resp.text
 
     def infraPortBlk(self, portprofdn, port):
@@ -156,46 +209,57 @@ class APIC(object):
         return name.split('/')[1]
 
     def create_interface_selector(self):
-        info = self.apic_migration_dict
         # Creates Interface Selector for for each switch
-        for switch in info.keys():
-            dn = 'uni/infra/accportprof-{}-intselector'.format(switch)
-            interface_selectors = {"infraAccPortP":
-                                       {"attributes":
-                                            {"dn": dn,
-                                             "name": "{}-intselector".format(switch)
-                                             },
-                                        "children": [{"infraHPortS":
-                                            {"attributes": {
-                                                "name": "ints",
-                                                "type": "range"
-                                            }
-
-                                            }
+        self.migration_leaves = []
+        for switch in self.apic_migration_dict.keys():
+            self.create_switch_interface_selector(switch)
+
+    def create_switch_interface_selector(self, switch):
+        """
+        Creates the interface selector for the migration interfaces of one
+        switch and the switch profile using it
+        :param switch: str switch name
+        :return: str dn of the selector
+        """
+        info = self.apic_migration_dict
+        dn = 'uni/infra/accportprof-{}-intselector'.format(switch)
+        interface_selectors = {"infraAccPortP":
+                                   {"attributes":
+                                        {"dn": dn,
+                                         "name": "{}-intselector".format(switch)
+                                         },
+                                    "children": [{"infraHPortS":
+                                        {"attributes": {
+                                            "name": "ints",
+                                            "type": "range"
                                         }
 
-                                        ]
-                                        }}
+                                        }
+                                    }
 
-            # Here we are getting just the port number info[switch] is a list of lists, so we need to break it down
-            names = map(lambda p: p[0], info[switch])
-            ports = [self.port_num_from_name(n) for n in names]
+                                    ]
+                                    }}
 
-            # Add portblk for each interface
-            children = [self.infraPortBlk(dn, p) for p in ports]
+        # Here we are getting just the port number info[switch] is a list of lists, so we need to break it down
+        names = map(lambda p: p[0], info[switch])
+        ports = [self.port_num_from_name(n) for n in names]
 
-            # Also need to associate policy-group
-            policy_group = {"infraRsAccBaseGrp": {"attributes": {"tDn": self.migration_vpc_dn}}}
-            children.append(policy_group)
+        # Add portblk for each interface
+        children = [self.infraPortBlk(dn, p) for p in ports]
 
-            interface_selectors['infraAccPortP']['children'][0]['infraHPortS']['children'] = children
+        # Also need to associate policy-group
+        policy_group = {"infraRsAccBaseGrp": {"attributes": {"tDn": self.migration_vpc_dn}}}
+        children.append(policy_group)
 
-            print interface_selectors
-            resp = self.session.push_to_apic('/api/mo/uni.json', interface_selectors)
+        interface_selectors['infraAccPortP']['children'][0]['infraHPortS']['children'] = children
 
-            # Now we associate the
-            self.create_node_profile(switch, dn)
-            print resp.text
+        print interface_selectors
+        resp = self._push('/api/mo/uni.json', interface_selectors)
+
+        # Now we associate the
+        self.create_node_profile(switch, dn)
+        print resp.text
+        return dn
 
     def create_10G_link_policy(self, name):
         """
@@ -213,7 +277,7 @@ class APIC(object):
                                      "nameAlias": "",
                                      "speed": "10G"}}}
 
-        resp = self.session.push_to_apic('/api/mo/uni.json', obj)
+        resp = self._push('/api/mo/uni.json', obj)
         return obj['fabricHIfPol']['attributes']['name']
 
     def create_lacp_policy(self, name):
@@ -229,7 +293,7 @@ class APIC(object):
                          }
                     }
                }
-        resp = self.session.push_to_apic('/api/mo/uni.json', obj)
+        resp = self._push('/api/mo/uni.json', obj)
         return obj['lacpLagPol']['attributes']['name']
 
     def create_cdp_policies(self, name):
@@ -242,7 +306,7 @@ class APIC(object):
                          }
                     }
                }
-        resp = self.session.push_to_apic('/api/mo/uni/infra.json', obj)
+        resp = self._push('/api/mo/uni/infra.json', obj)
         return obj['cdpIfPol']['attributes']['name']
 
     def create_aep(self, name):
@@ -254,7 +318,7 @@ class APIC(object):
                          },
                     "children": [{"infraRsDomP": {"attributes": {"tDn": "uni/phys-{}".format(self.physdom)}}}]}}
         print obj
-        resp = self.session.push_to_apic('/api/mo/uni/infra.json', obj)
+        resp = self._push('/api/mo/uni/infra.json', obj)
         return obj['infraAttEntityP']['attributes']['dn']
 
     def create_vpc_policy_group(self, name):
@@ -271,11 +335,22 @@ class APIC(object):
         """
 
         # Create the necessary policies for constructing the policy group
-        cdp = self.create_cdp_policies('acimigrate-cdp-policy')
-        lacp = self.create_lacp_policy('acimigrate-lacp-policy')
-        link = self.create_10G_link_policy('aci-migrate-link-policy')
-        aep = self.create_aep('acimigrate-aep')
+        cdp = self.create_cdp_policies(CDP_POLICY_NAME)
+        lacp = self.create_lacp_policy(LACP_POLICY_NAME)
+        link = self.create_10G_link_policy(LINK_POLICY_NAME)
+        aep = self.create_aep(AEP_NAME)
+        return self.vpc_policy_group(name, cdp, lacp, link, aep)
 
+    def vpc_policy_group(self, name, cdp, lacp, link, aep):
+        """
+        Creates the VPC policy group from existing policies
+        :param name: name for the VPC
+        :param cdp: str cdp policy name
+        :param lacp: str lacp policy name
+        :param link: str link level policy name
+        :param aep: str dn of the AEP
+        :return: str dn of the policy group
+        """
         obj = {"infraAccBndlGrp":
                    {"attributes":
                         {"dn": "uni/infra/funcprof/accbundle-{}".format(name),
@@ -302,18 +377,19 @@ class APIC(object):
         # Update the dn of the migration vpc so that it can be used later
         self.migration_vpc_dn = obj['infraAccBndlGrp']['attributes']['dn']
         self.migration_vpc_rn = name
-        resp = self.session.push_to_apic('/api/mo/uni/infra/funcprof.json', obj)
+        resp = self._push('/api/mo/uni/infra/funcprof.json', obj)
         return self.migration_vpc_dn
 
-    def migration_physdom(self, domain_name, vlans):
+    def migration_physdom(self, domain_name, vlans, incremental=False):
         """
         Create a physdom for migration connectivity
         :param domain_name:
         :param vlans:
+        :param incremental: bool only add missing vlans to an existing pool
         :return:
         """
         self.physdom = domain_name
-        pool_dn = self.migration_vlan_pool(vlans=vlans)
+        pool_dn = self.migration_vlan_pool(vlans=vlans, incremental=incremental)
         dom_json = {"physDomP":
                         {"attributes":
                              {"dn": "uni/phys-{}".format(self.physdom),
@@ -324,9 +400,41 @@ class APIC(object):
                                  "tDn": "{}".format(pool_dn),
                                  "status": "created"}, "children": []}}]}}
         print "Creating Physical Domain {}".format(self.physdom)
-        resp = self.session.push_to_apic('/api/mo/uni.json', dom_json)
+        resp = self._push('/api/mo/uni.json', dom_json)
         print resp.text
 
+    def schedule_migration_policies(self, scheduler, domain_name, vlans, vpc_name, incremental=False):
+        """
+        Adds the access policy pushes for the migration to a PushScheduler.
+        The vlan pool and physdom come before the AEP, the cdp, lacp and link
+        policies have no dependencies, the vpc policy group waits for all of
+        them and each switch's interface selector and profile follow it.
+
+        :param scheduler: PushScheduler
+        :param domain_name: str physdom name
+        :param vlans: list of vlan ids for the pool
+        :param vpc_name: str name of the vpc policy group
+        :param incremental: bool only add missing vlans to an existing pool
+        :return: list of task names the EPG pushes must wait for
+        """
+        # the selector tasks fill this in again for this run's leaves
+        self.migration_leaves = []
+        scheduler.add('physdom', lambda: self.migration_physdom(domain_name, vlans, incremental=incremental))
+        scheduler.add('cdp-policy', lambda: self.create_cdp_policies(CDP_POLICY_NAME))
+        scheduler.add('lacp-policy', lambda: self.create_lacp_policy(LACP_POLICY_NAME))
+        scheduler.add('link-policy', lambda: self.create_10G_link_policy(LINK_POLICY_NAME))
+        scheduler.add('aep', lambda: self.create_aep(AEP_NAME), after=['physdom'])
+        scheduler.add('vpc-policy-group',
+                      lambda: self.vpc_policy_group(vpc_name, CDP_POLICY_NAME, LACP_POLICY_NAME,
+                                                    LINK_POLICY_NAME, 'uni/infra/attentp-{}'.format(AEP_NAME)),
+                      after=['cdp-policy', 'lacp-policy', 'link-policy', 'aep'])
+        selectors = []
+        for switch in sorted(self.apic_migration_dict or {}):
+            selectors.append(scheduler.add('interface-selector-{}'.format(switch),
+                                           lambda s=switch: self.create_switch_interface_selector(s),
+                                           after=['vpc-policy-group']))
+        return ['physdom'] + selectors
+
     def migration_tenant(self, tenant_name, app_name, provision=True):
         self.tenant = aci.Tenant(tenant_name)
         print self.tenant.get_url()
@@ -345,24 +453,25 @@ class APIC(object):
             self.tenant.get_json()
         return self.tenant
 
-    def create_epg_for_vlan(self, name, num, mac_address=None, net=None, provision=True):
+    def _build_epg(self, name, mac_address=None, nets=None):
         """
-        This creates the EPG for a given EPG, it is generally called from the main migration routine
+        Adds the EPG and its BD for a vlan to the in-memory tenant
 
         :param name: str name for the vlan
-        :param num: str vlan id
         :param mac_address: str
-        :param net: str
-        :param provision: bool
-        :return:
+        :param nets: list of str gateway addresses e.g. 10.1.1.1/24
+        :return: aci.EPG
         """
-
         epg = aci.EPG(name, self.app)
         bd = aci.BridgeDomain(name, self.tenant)
 
-        if net:
-            subnet = aci.Subnet('subnet-' + name, parent=bd)
-            subnet.set_addr(net)
+        if nets:
+            for count, net in enumerate(nets):
+                subnet_name = 'subnet-' + name
+                if count:
+                    subnet_name = '{}-{}'.format(subnet_name, count)
+                subnet = aci.Subnet(subnet_name, parent=bd)
+                subnet.set_addr(net)
             bd.set_unicast_route('yes')
         else:
             bd.set_unicast_route('no')
@@ -379,45 +488,283 @@ class APIC(object):
         # Attach physdom
         dom = aci.EPGDomain('acimigrate', epg)
         dom.tDn = 'uni/phys-{}'.format(self.physdom)
+        return epg
+
+    def migration_protpath_dn(self):
+        """
+        :return: str dn of the migration vpc protpath between the migration leaves
+        """
+        self.migration_leaves = sorted(self.migration_leaves)
+        return "topology/pod-1/protpaths-{}-{}/pathep-[{}]".format(self.migration_leaves[0],
+                                                                   self.migration_leaves[1],
+                                                                   self.migration_vpc_rn)
+
+    def static_path_binding(self, num):
+        """
+        Builds the fvRsPathAtt binding a vlan to the migration vpc
+        :param num: str vlan id
+        :return: dict
+        """
+        return {"fvRsPathAtt": {"attributes": {"encap": "vlan-{}".format(num),
+                                               "tDn": self.migration_protpath_dn(),
+                                               "status": "created,modified"},
+                                "children": []}}
+
+    def _bind_static_path(self, num, epg):
+        """
+        Adds the static binding for the migration vpc to an EPG
+        :param num: str vlan id
+        :param epg: aci.EPG or str epg name
+        :return: response
+        """
+        c = self.static_path_binding(num)
+
+        epgurl = '/api/mo/uni/tn-{}/ap-{}/epg-{}.json'.format(self.tenant,
+                                                              self.app,
+                                                              epg)
+        print "Creating static path binding for {}....".format(c['fvRsPathAtt']['attributes']['tDn']),
+
+        bindresp = self.session.push_to_apic(epgurl, c)
+        print bindresp.status_code
+        return bindresp
+
+    def _add_static_paths(self, tenant_json, vlan_names):
+        """
+        Adds the static path binding as a child of each migrated EPG so the
+        bindings are committed with the tenant instead of one POST per vlan
+        :param tenant_json: dict output of aci.Tenant.get_json()
+        :param vlan_names: dict of vlan name -> vlan id
+        :return: tenant_json
+        """
+        for child in tenant_json['fvTenant'].get('children', []):
+            if 'fvAp' not in child:
+                continue
+            for epg in child['fvAp'].get('children', []):
+                if 'fvAEPg' not in epg:
+                    continue
+                name = epg['fvAEPg']['attributes']['name']
+                if name in vlan_names:
+                    epg['fvAEPg'].setdefault('children', []).append(
+                        self.static_path_binding(vlan_names[name]))
+        return tenant_json
+
+    def create_epg_for_vlan(self, name, num, mac_address=None, net=None, provision=True):
+        """
+        This creates the EPG for a given EPG, it is generally called from the main migration routine
+
+        :param name: str name for the vlan
+        :param num: str vlan id
+        :param mac_address: str
+        :param net: str
+        :param provision: bool
+        :return:
+        """
+        nets = [net] if net else None
+        epg = self._build_epg(name, mac_address=mac_address, nets=nets)
 
+        resp = None
         if provision:
             resp = self.session.push_to_apic(self.tenant.get_url(), self.tenant.get_json())
             print resp.text
             # Add static binding for migration interface
-            self.migration_leaves = sorted(self.migration_leaves)
-            protep_str = "topology/pod-1/protpaths-{}-{}/pathep-[{}]".format(self.migration_leaves[0],
-                                                                             self.migration_leaves[1],
-                                                                             self.migration_vpc_rn)
-
-            c = {"fvRsPathAtt": {"attributes": {"encap": "vlan-{}".format(num),
-                                                "tDn": protep_str,
-                                                "status": "created"},
-                                 "children": []}}
-
-            epgurl = '/api/mo/uni/tn-{}/ap-{}/epg-{}.json'.format(self.tenant,
-                                                                  self.app,
-                                                                  epg)
-            print "Creating static path binding for {}....".format(protep_str),
-
-            bindresp = self.session.push_to_apic(epgurl, c)
-            print bindresp.status_code
+            self._bind_static_path(num, epg)
 
         else:
             print self.tenant.get_json()
 
         return resp
 
-    def list_switches(self):
-        phy_class = (Node)
-        switches = phy_class.get(self.session)
-        return switches
+    def _push(self, url, obj):
+        """
+        Pushes obj, retrying while the APIC is throttling
+        :return: response
+        :raises PushError: when the APIC rejects the push
+        """
+        resp = with_retry(lambda: self.session.push_to_apic(url, obj))
+        if not resp.ok:
+            raise PushError('{} returned {}: {}'.format(url, resp.status_code, self._apic_error(resp)), resp=resp)
+        return resp
+
+    @staticmethod
+    def _apic_error(resp):
+        """
+        Extracts the error text from a failed APIC response
+        """
+        try:
+            return resp.json()['imdata'][0]['error']['attributes']['text']
+        except (ValueError, KeyError, IndexError):
+            return resp.text
+
+    def _tenant_batches(self, tenant_json, vlan_names):
+        """
+        Splits the tenant json into bounded size tenant payloads, keeping the
+        BD and EPG of a vlan in the same payload
+
+        :param tenant_json: dict output of aci.Tenant.get_json()
+        :param vlan_names: dict of vlan name -> vlan id
+        :return: list of (payload, list of vlan ids)
+        """
+        tenant_attributes = tenant_json['fvTenant']['attributes']
+        common = []
+        app_attributes = {}
+        per_vlan = {}
+        for child in tenant_json['fvTenant'].get('children', []):
+            cls = child.keys()[0]
+            if cls == 'fvBD' and child[cls]['attributes']['name'] in vlan_names:
+                name = child[cls]['attributes']['name']
+                per_vlan.setdefault(name, {'bd': [], 'epg': []})['bd'].append(child)
+            elif cls == 'fvAp':
+                app = child[cls]
+                app_name = app['attributes']['name']
+                app_attributes[app_name] = app['attributes']
+                leftover = []
+                for epg in app.get('children', []):
+                    name = epg.values()[0]['attributes']['name']
+                    if epg.keys()[0] == 'fvAEPg' and name in vlan_names:
+                        per_vlan.setdefault(name, {'bd': [], 'epg': []})['epg'].append((app_name, epg))
+                    else:
+                        leftover.append(epg)
+                common.append({'fvAp': {'attributes': app['attributes'], 'children': leftover}})
+            else:
+                common.append(child)
+
+        def payload(children, epgs):
+            apps = {}
+            for app_name, epg in epgs:
+                apps.setdefault(app_name, []).append(epg)
+            for app_name in sorted(apps):
+                children.append({'fvAp': {'attributes': app_attributes[app_name],
+                                          'children': apps[app_name]}})
+            return {'fvTenant': {'attributes': tenant_attributes, 'children': children}}
+
+        batches = []
+        children, epgs, nums, size = list(common), [], [], 0
+        for name in sorted(per_vlan, key=lambda n: int(vlan_names[n])):
+            objs = per_vlan[name]
+            vlan_size = len(json.dumps(objs['bd'])) + len(json.dumps([e for a, e in objs['epg']]))
+            if nums and (len(nums) >= APIC_BATCH_SIZE or size + vlan_size > APIC_BATCH_MAX_BYTES):
+                batches.append((payload(children, epgs), nums))
+                children, epgs, nums, size = [], [], [], 0
+            children.extend(objs['bd'])
+            epgs.extend(objs['epg'])
+            nums.append(vlan_names[name])
+            size += vlan_size
+        if nums or children:
+            batches.append((payload(children, epgs), nums))
+        return batches
+
+    def create_epgs_for_vlans(self, vlans, provision=True, callback=None, workers=SCHEDULER_WORKERS):
+        """
+        Creates the EPG, BD and migration vpc static path for every vlan and
+        commits the tenant in as few POSTs as APIC_BATCH_SIZE and
+        APIC_BATCH_MAX_BYTES allow, rather than re-pushing the whole tenant
+        and binding the path once per vlan
+
+        :param vlans: dict of vlan id -> {'name': str, 'mac_address': str, 'nets': list}
+        :param provision: bool
+        :param callback: callable(vlan id, status, elapsed) run as each batch completes
+        :param workers: int batches pushed at once
+        :return: dict of vlan id -> status str
+        """
+        vlan_names = {}
+        for num in vlans:
+            name = vlans[num]['name']
+            self._build_epg(name,
+                            mac_address=vlans[num].get('mac_address'),
+                            nets=vlans[num].get('nets'))
+            vlan_names[name] = num
+
+        result = {}
+        tenant_json = self.tenant.get_json()
+        if provision:
+            self._add_static_paths(tenant_json, vlan_names)
+        batches = self._tenant_batches(tenant_json, vlan_names)
+        if not provision:
+            for obj, nums in batches:
+                print obj
+                for num in nums:
+                    result[num] = 'NOT PROVISIONED'
+            return result
+
+        def push_batch(count, obj, nums):
+            print "Pushing tenant batch {} of {} ({} vlans)".format(count + 1, len(batches), len(nums))
+            start = time.time()
+            resp = with_retry(lambda: self.session.push_to_apic(self.tenant.get_url(), obj))
+            elapsed = time.time() - start
+            if resp.ok:
+                status = 'SUCCESS'
+            else:
+                status = 'FAILED: {}'.format(self._apic_error(resp))
+                print status
+            for num in nums:
+                result[num] = status
+                if callback:
+                    callback(num, status, elapsed)
+
+        # the first batch carries the vrf and contract the others refer to,
+        # the remaining batches are independent of each other
+        scheduler = PushScheduler(workers=workers)
+        for count, (obj, nums) in enumerate(batches):
+            scheduler.add('tenant-batch-{}'.format(count),
+                          lambda c=count, o=obj, n=nums: push_batch(c, o, n),
+                          after=['tenant-batch-0'] if count else [])
+        scheduler.run()
+        return result
+
+    def list_switches(self, role=None):
+        """
+        Streams the fabric nodes
+        :param role: str only return nodes with this role e.g. leaf
+        :return: generator of Switch
+        """
+        query_filter = None
+        if role:
+            query_filter = 'eq(fabricNode.role,"{}")'.format(role)
+        for mo in iter_class(self.session, 'fabricNode', query_filter=query_filter):
+            yield switch_from_attributes(attributes(mo))
+
+    def list_leaves(self):
+        """
+        :return: dict of leaf name -> node id
+        """
+        self.leaf_nodes = dict((s.name, s.node) for s in self.list_switches(role='leaf'))
+        return self.leaf_nodes
+
+    def _load_node_interfaces(self, node):
+        """
+        Reads the physical interfaces of one node with an l1PhysIf class
+        query, asking only for the naming properties
+
+        :param node: str node id
+        :return: list of PhysIf
+        """
+        mos = iter_class(self.session, 'l1PhysIf',
+                         query_filter='wcard(l1PhysIf.dn,"/node-{}/")'.format(node),
+                         rsp_prop_include='naming-only')
+        return [physif_from_attributes(attributes(mo)) for mo in mos]
 
     def get_switch_interfaces(self, node):
-        int_list = []
-        for int in self.fabric_interfaces:
-            if int.node == node:
-                int_list.append(int)
-        return int_list
+        """
+        :param node: str node id
+        :return: list of PhysIf on the node, shared with the inventory
+        """
+        return self.inventory.interfaces(node)
+
+    def get_leaf_interface_ids(self, name):
+        """
+        :param name: str leaf name
+        :return: list of str interface ids on the leaf
+        """
+        return self.inventory.interface_ids(self.leaf_nodes[name])
+
+    def refresh_switch_interfaces(self, node):
+        """
+        Re-reads the interfaces of a single node into the inventory
+        :param node: str node id
+        :return: list of PhysIf on the node
+        """
+        self.inventory.refresh_node(node, self._load_node_interfaces(node))
+        return self.inventory.interfaces(node)
 
 
 class Nexus(object):
@@ -426,23 +773,62 @@ class Nexus(object):
 
     """
 
-    def __init__(self, host, user, passwd):
+    def __init__(self, host, user, passwd, pool=netconf_pool, port=22):
         self.host = host
         self.user = user
         self.passwd = passwd
-        self.port = 22
+        self.port = port
         self.hostkey_verify = False
         self.device_params = {'name': 'nexus'}
         self.allow_agent = False
         self.look_for_keys = False
-        self.manager = manager.connect(host=self.host,
-                                       port=22,
-                                       username=self.user,
-                                       password=self.passwd,
-                                       hostkey_verify=False,
-                                       device_params={'name': 'nexus'},
-                                       allow_agent=False,
-                                       look_for_keys=False)
+        # NETCONF sessions are borrowed from the pool for each RPC
+        self.pool = pool
+        self.pool_key = credential_key(self.host, self.port, self.user, self.passwd)
+        # fail early on bad credentials or an unreachable device
+        with self.pool.session(self.pool_key, self._connect):
+            pass
+        self.snapshot = Snapshot()
+
+    def _connect(self):
+        return manager.connect(host=self.host,
+                               port=self.port,
+                               username=self.user,
+                               password=self.passwd,
+                               hostkey_verify=self.hostkey_verify,
+                               device_params=self.device_params,
+                               allow_agent=self.allow_agent,
+                               look_for_keys=self.look_for_keys)
+
+    def rpc(self, func):
+        """
+        Runs func(manager) on a pooled NETCONF session
+        """
+        return self.pool.call(self.pool_key, self._connect, func)
+
+    # show-command tables held in the discovery snapshot
+    snapshot_tables = ('vlan_dict', 'hsrp_dict', 'svi_dict',
+                       'port_channel_dict', 'vpc_dict', 'phy_interface_dict')
+    # tables vlan_model is joined from
+    vlan_model_tables = ('vlan_dict', 'hsrp_dict', 'svi_dict')
+
+    def invalidate(self, *tables):
+        """
+        Drops tables from the discovery snapshot, all of them if none given
+        """
+        if set(tables) & set(self.vlan_model_tables):
+            tables += ('vlan_model',)
+        self.snapshot.invalidate(*tables)
+
+    def refresh(self):
+        """
+        Re-reads every show-command table from the device
+        :return: self
+        """
+        self.snapshot.invalidate()
+        for table in self.snapshot_tables:
+            getattr(self, table)
+        return self
 
     cmd_default_int_snippet = """
         <default>
@@ -514,14 +900,7 @@ class Nexus(object):
               </interface>
     """
 
-    cmd_no_vlan_int_snippet = """
-          <config xmlns:xc="urn:ietf:params:xml:ns:netconf:base:1.0">
-            <configure xmlns="http://www.cisco.com/nxos:1.0:vlan_mgr_cli">
-              <__XML__MODE__exec_configure>
-              <interface>
-                <ethernet>
-                  <interface>%s</interface>
-                  <__XML__MODE_if-ethernet-switch>
+    cmd_no_vlan_common = """
                     <switchport>
                       <trunk>
                         <allowed>
@@ -533,12 +912,6 @@ class Nexus(object):
                         </allowed>
                       </trunk>
                     </switchport>
-                  </__XML__MODE_if-ethernet-switch>
-                </ethernet>
-              </interface>
-              </__XML__MODE__exec_configure>
-            </configure>
-          </config>
     """
 
     cmd_vlan_common = """
@@ -564,7 +937,7 @@ class Nexus(object):
               <__XML__MODE_if-eth-port-channel-switch>
                 %s
               </__XML__MODE_if-eth-port-channel-switch>
-            </ethernet>
+            </Port-Channel>
           </interface>
     """
 
@@ -575,6 +948,27 @@ class Nexus(object):
             </vlan>
           </show> """
 
+    def _get(self, query):
+        """
+        Sends a subtree filtered get to the device
+        :param query: str subtree filter
+        :return: str reply xml
+        """
+        return self.rpc(lambda m: str(m.get(('subtree', query))))
+
+    def _edit_config(self, config):
+        """
+        Sends an edit_config for the running configuration
+        :param config: str config xml
+        """
+        return self.rpc(lambda m: m.edit_config(target='running', config=config))
+
+    def config_builder(self):
+        """
+        :return: ConfigBuilder for exec_configure snippets on this device
+        """
+        return ConfigBuilder(self.exec_conf_prefix, self.exec_conf_postfix)
+
     @staticmethod
     def format_mac_address(mac):
         """
@@ -589,7 +983,7 @@ class Nexus(object):
                                                 mac[10:12],
                                                 mac[12:14])
 
-    @property
+    @snapshot_property
     def port_channel_dict(self):
         query = '''
             <show>
@@ -598,48 +992,26 @@ class Nexus(object):
                 </port-channel>
             </show>
             '''
-        ncdata = str(self.manager.get(('subtree', query)))
-        root = ET.fromstring(ncdata)
-        pc_ns_map = {'groups': 'http://www.cisco.com/nxos:1.0:eth_pcm_dc3'}
         pc_dict = {}
 
-        for c in root.iter():
-            pcs = (c.findall('groups:ROW_channel', pc_ns_map))
-            for pc in pcs:
-                portchannel = pc.find('groups:group', pc_ns_map).text
-                member_list = []
-                for row in pc:
-                    ints = row.findall('groups:ROW_member', pc_ns_map)
-                    for int in ints:
-                        interface = int.find('groups:port', pc_ns_map).text
-                        member_list.append(interface)
-                pc_dict[portchannel] = member_list
+        for pc in PC_TABLE.rows(self._get(query)):
+            pc_dict[pc.group] = [m.port for m in pc.members]
         # print pc_dict
         return pc_dict
 
-    @property
+    @snapshot_property
     def vpc_dict(self):
         query = '''
             <show>
                 <vpc/>
             </show>
             '''
-        ncdata = str(self.manager.get(('subtree', query)))
-        root = ET.fromstring(ncdata)
-        vpc_ns_map = {'groups': 'http://www.cisco.com/nxos:1.0:mcecm'}
         vpc_dict = {}
-        vpc_id_list = []
-
-        for c in root.iter():
-            vpcs = (c.findall('groups:ROW_vpc', vpc_ns_map))
-            for vpc in vpcs:
-                vpc_id = vpc.find('groups:vpc-id', vpc_ns_map).text
-                vpc_id_list.append(vpc_id)
-        vpc_dict["vpc_list"] = vpc_id_list
+        vpc_dict["vpc_list"] = [vpc.vpc_id for vpc in VPC_TABLE.rows(self._get(query))]
         print vpc_dict
         return vpc_dict
 
-    @property
+    @snapshot_property
     def phy_interface_dict(self):
         query = '''
             <show>
@@ -648,92 +1020,50 @@ class Nexus(object):
                 </interface>
             </show>
         '''
-
-        ncdata = str(self.manager.get(('subtree', query)))
-        root = ET.fromstring(ncdata)
-        int_ns_map = {'groups': 'http://www.cisco.com/nxos:1.0:if_manager'}
         int_list = []
 
-        for c in root.iter():
-            ints = (c.findall('groups:ROW_interface', int_ns_map))
-            for int in ints:
-                interface = int.find('groups:interface', int_ns_map).text
-                if interface.startswith("Ethernet"):
-                    int_list.append(interface)
+        for row in INTERFACE_TABLE.rows(self._get(query)):
+            if row.interface.startswith("Ethernet"):
+                int_list.append(row.interface)
 
         return int_list
 
-    @property
+    @snapshot_property
     def vlan_dict(self):
         query = '''
               <show>
                 <vlan/>
               </show>
         '''
-
-        ncdata = str(self.manager.get(('subtree', query)))
-        root = ET.fromstring(ncdata)
-        namespace_map = {'vlans': 'http://www.cisco.com/nxos:1.0:vlan_mgr_cli'}
         vlan_dict = {}
 
-        for c in root.iter():
-            vlans = c.findall('vlans:ROW_vlanbrief', namespace_map)
-            for v in vlans:
-                vlanid = v.find('vlans:vlanshowbr-vlanid-utf', namespace_map).text
-                vlan_name = v.find('vlans:vlanshowbr-vlanname', namespace_map).text
-                vlan_dict[vlanid] = vlan_name
+        for v in VLAN_TABLE.rows(self._get(query)):
+            vlan_dict[v.vlanid] = v.name
 
         return vlan_dict
 
-    @property
+    @snapshot_property
     def svi_dict(self):
         query = '''
             <show>
               <ip>
                 <interface/>
+              </ip>
             </show>
         '''
-
-        ncdata = str(self.manager.get(('subtree', query)))
-        root = ET.fromstring(ncdata)
-        svi_ns_map = {'groups': 'http://www.cisco.com/nxos:1.0:ip'}
         svi_dict = {}
 
-        for c in root.iter():
-            svi_intfs = (c.findall('groups:ROW_intf', svi_ns_map))
-            for i in svi_intfs:
-                subnet_list = []
-                mask_list = []
-                intf = i.find('groups:intf-name', svi_ns_map).text
-                subnet = i.find('groups:subnet', svi_ns_map).text
-                subnet_list.append(subnet)
-                mask = i.find('groups:masklen', svi_ns_map).text
-                mask_list.append(mask)
-
-                secondaries = i.find('groups:TABLE_secondary_address', svi_ns_map)
-                if secondaries is not None:
-                    count = 0
-                    for sec in secondaries.iter():
-                        count = count + 1
-                        # print count
-                        # print sec
-                        rows = sec.getchildren()
-                        for row in rows:
-                            # print row.attrib
-                            subnetx = row.find('groups:subnet' + str(count), svi_ns_map)
-                            if subnetx is not None:
-                                subnetx = subnetx.text
-                                subnet_list.append(subnetx)
-                            maskx = row.find('groups:masklen' + str(count), svi_ns_map)
-                            if maskx is not None:
-                                maskx = maskx.text
-                                mask_list.append(maskx)
-
-                svi_dict[intf] = {'subnets': subnet_list, 'masks': mask_list}
+        for i in SVI_TABLE.rows(self._get(query)):
+            subnet_list = [i.subnet]
+            mask_list = [i.masklen]
+            for sec in i.secondaries:
+                subnet_list.extend(sec.subnets)
+                mask_list.extend(sec.masks)
+            svi_dict[i.intf] = {'subnets': subnet_list, 'masks': mask_list}
         # print "svi_dict: " , svi_dict
         return svi_dict
 
-    @property
+    @snapshot_property
     def hsrp_dict(self):
         query = '''
                   <show>
@@ -742,58 +1072,91 @@ class Nexus(object):
                     </hsrp>
                   </show>
                       '''
-        ncdata = str(self.manager.get(('subtree', query)))
-        root = ET.fromstring(ncdata)
-        hsrp_ns_map = {'groups': 'http://www.cisco.com/nxos:1.0:hsrp_engine'}
         hsrp_dict = {}
 
-        for c in root.iter():
-            hsrp_intfs = (c.findall('groups:ROW_grp_detail', hsrp_ns_map))
-            for i in hsrp_intfs:
-                vip_list = []
-                intf = i.find('groups:sh_if_index', hsrp_ns_map).text
-                vip = i.find('groups:sh_vip', hsrp_ns_map).text
-                vip_list.append(vip)
-                mac = i.find('groups:sh_vmac', hsrp_ns_map).text
-
-                # Check for secondary HSRP addresses
-                secondaries = i.find('groups:TABLE_grp_vip_sec', hsrp_ns_map)
-                if secondaries is not None:
-                    for sec in secondaries.iter():
-                        ips = sec.findall('groups:sh_vip_sec', hsrp_ns_map)
-                        for ip in ips:
-                            vip_list.append(ip.text)
-
-                hsrp_dict[intf] = {'vmac': self.format_mac_address(mac),
-                                   'vips': vip_list}
+        for i in HSRP_TABLE.rows(self._get(query)):
+            # Check for secondary HSRP addresses
+            vip_list = [i.vip] + [sec.vip for sec in i.secondaries]
+            hsrp_dict[i.intf] = {'vmac': self.format_mac_address(i.vmac),
+                                 'vips': vip_list}
         return hsrp_dict
 
     def enable_vlan(self, vlanid, vlanname):
-        confstr = self.cmd_vlan_conf_snippet % (vlanid, vlanname)
-        confstr = self.exec_conf_prefix + confstr + self.exec_conf_postfix
-        self.manager.edit_config(target='running', config=confstr)
+        self.enable_vlans({vlanid: vlanname})
+
+    def enable_vlans(self, vlans):
+        """
+        Creates vlans in as few edit_config RPCs as possible
+        :param vlans: dict of vlan id -> vlan name
+        :return: list of str commands applied
+        """
+        builder = self.config_builder()
+        for vlanid in sorted(vlans, key=int):
+            builder.add('vlan {} name {}'.format(vlanid, vlans[vlanid]),
+                        self.cmd_vlan_conf_snippet % (vlanid, vlans[vlanid]))
+        try:
+            return builder.apply(self._edit_config)
+        finally:
+            # vlan table changed, next read must hit the device
+            self.invalidate('vlan_dict')
+
+    def _trunk_vlans(self, interface, vlans, common, action, port_channel=False):
+        """
+        Adds or removes a vlan set on a trunk using NX-OS range syntax, split
+        so no vlan list is longer than the CLI accepts
+        :param interface: str e.g. Ethernet1/1 or port-channel10
+        :param vlans: iterable of vlan ids
+        :param common: str switchport snippet taking the vlan list
+        :param action: str add or remove, used for reporting
+        :param port_channel: bool treat interface as a port-channel
+        :return: list of str commands applied
+        """
+        builder = self.config_builder()
+        for vlan_list in range_strings(vlans):
+            switchport = common % vlan_list
+            if '/' in interface and not port_channel:
+                confstr = self.cmd_vlan_int_snippet % (interface, switchport)
+            else:
+                confstr = self.cmd_vlan_pc_snippet % (interface, switchport)
+            builder.add('interface {} switchport trunk allowed vlan {} {}'.format(interface, action, vlan_list),
+                        confstr)
+        return builder.apply(self._edit_config)
+
+    def enable_vlans_on_trunk_int(self, interface, vlans):
+        """
+        Allows a set of vlans on a trunk interface or port-channel
+        :param interface: str
+        :param vlans: iterable of vlan ids
+        :return: list of str commands applied
+        """
+        return self._trunk_vlans(interface, vlans, self.cmd_vlan_common, 'add')
+
+    def enable_vlans_on_trunk_pc(self, interface, vlans):
+        """
+        Allows a set of vlans on a port-channel trunk
+        :param interface: str port-channel name
+        :param vlans: iterable of vlan ids
+        :return: list of str commands applied
+        """
+        return self._trunk_vlans(interface, vlans, self.cmd_vlan_common, 'add', port_channel=True)
+
+    def disable_vlans_on_trunk_int(self, interface, vlans):
+        """
+        Removes a set of vlans from a trunk interface
+        :param interface: str
+        :param vlans: iterable of vlan ids
+        :return: list of str commands applied
+        """
+        return self._trunk_vlans(interface, vlans, self.cmd_no_vlan_common, 'remove')
 
     def enable_vlan_on_trunk_int(self, interface, vlanid):
-        switchport = self.cmd_vlan_common % vlanid
-        if '/' in interface:
-            confstr = self.cmd_vlan_int_snippet % (interface, switchport)
-        else:
-            confstr = self.cmd_vlan_pc_snippet % (interface, switchport)
-        confstr = self.exec_conf_prefix + confstr + self.exec_conf_postfix
-        self.manager.edit_config(target='running', config=confstr)
+        self.enable_vlans_on_trunk_int(interface, [vlanid])
 
     def enable_vlan_on_trunk_pc(self, interface, vlanid):
-        switchport = self.cmd_vlan_common % vlanid
-        confstr = self.cmd_vlan_pc_snippet % (interface,
-                                              switchport)
-
-        confstr = self.exec_conf_prefix + confstr + self.exec_conf_postfix
-        self.manager.edit_config(target='running', config=confstr)
+        self.enable_vlans_on_trunk_pc(interface, [vlanid])
 
     def disable_vlan_on_trunk_int(self, interface, vlanid):
-        confstr = self.cmd_no_vlan_int_snippet % (interface, vlanid)
-        print confstr
-        self.manager.edit_config(target='running', config=confstr)
+        self.disable_vlans_on_trunk_int(interface, [vlanid])
 
     def build_xml(self, cmd):
         args = cmd.split(' ')
@@ -804,27 +1167,23 @@ class Nexus(object):
 
     def run_cmd(self, cmd):
         xml = self.build_xml(cmd)
-        ncdata = str(self.manager.get(('subtree', xml)))
+        ncdata = self._get(xml)
         return ncdata
 
-    def migration_dict(self):
+    @snapshot_property
+    def vlan_model(self):
+        """
+        Vlans joined with their SVI and HSRP addressing
+        :return: DiscoveryModel
         """
-        Merges Nexus.vlan_dict and Nexus.hsrp_dict
+        return DiscoveryModel.from_tables(self.vlan_dict, self.svi_dict, self.hsrp_dict)
 
+    def migration_dict(self):
         """
-        migrate_dict = {}
-        migrate_dict['vlans'] = {}
-        for v in self.vlan_dict.keys():
-            migrate_dict['vlans'][v] = {'name': self.vlan_dict[v]}
-            if 'Vlan{0}'.format(v) in self.hsrp_dict.keys():
-                migrate_dict['vlans'][v]['hsrp'] = self.hsrp_dict['Vlan{0}'.format(v)]
-                migrate_dict['vlans'][v]['hsrp'].update(self.svi_dict['Vlan{0}'.format(v)])
-            else:
-                migrate_dict['vlans'][v]['hsrp'] = None
-        # migrate_dict['interfaces'] = self.free_interfaces()
-        # print self.port_channel_dict
-        # print self.free_interfaces()
-        return migrate_dict
+        Merges Nexus.vlan_dict, Nexus.svi_dict and Nexus.hsrp_dict
+        :return: dict of 'vlans' -> vlan id -> {'name', 'hsrp'}
+        """
+        return self.vlan_model.to_dict()
 
     def pc_list(self):
 
@@ -838,10 +1197,11 @@ class Nexus(object):
         Removes interfaces that are currently in use by existing port-channels
         :return:
         """
-        used_int_list = []
-        for pc in self.port_channel_dict:
-            for int in self.port_channel_dict[pc]:
-                used_int_list.append(int)
+        port_channel_dict = self.port_channel_dict
+        used_int_list = set()
+        for pc in port_channel_dict:
+            for int in port_channel_dict[pc]:
+                used_int_list.add(int)
 
         # print used_int_list
 
@@ -852,20 +1212,13 @@ class Nexus(object):
 
     def cdp_neighbors(self):
         query = self.build_xml('show cdp neighbor')
-        ncdata = str(self.manager.get(('subtree', query)))
-        root = ET.fromstring(ncdata)
         neighbors = {}
-        cdp_ns_map = {'mod': 'http://www.cisco.com/nxos:1.0:cdpd'}
-        for c in root.iter(tag='{http://www.cisco.com/nxos:1.0:cdpd}ROW_cdp_neighbor_brief_info'):
-            neighbor = c.find('mod:device_id', cdp_ns_map).text
-            myintf = c.find('mod:intf_id', cdp_ns_map).text
-            neigh_intf = c.find('mod:port_id', cdp_ns_map).text
-            platform = c.find('mod:platform_id', cdp_ns_map).text
-            neighbor = neighbor.split('(')[0]
-
-            neighbors[neighbor] = {'local_intf': myintf,
-                                   'neighbor_intf': neigh_intf,
-                                   'platform': platform,
+        for c in CDP_TABLE.rows(self._get(query)):
+            neighbor = c.device_id.split('(')[0]
+
+            neighbors[neighbor] = {'local_intf': c.intf_id,
+                                   'neighbor_intf': c.port_id,
+                                   'platform': c.platform_id,
                                    }
         return neighbors
 
@@ -876,18 +1229,21 @@ class Nexus(object):
         :param interfaces:
         :return:
         """
+        builder = self.config_builder()
         for interface in interfaces:
-            default = self.cmd_default_int_snippet % interface
-            port_config = self.cmd_config_pc_trunk % (interface, pc)
-
-            confstr = default + port_config
-            confstr = self.exec_conf_prefix + confstr + self.exec_conf_postfix
-            self.manager.edit_config(target='running', config=confstr)
-
-        confstr = self.cmd_config_vpc_member % (pc, pc)
-        confstr = self.exec_conf_prefix + confstr + self.exec_conf_postfix
-        self.manager.edit_config(target='running', config=confstr)
-
+            builder.add('default interface {}'.format(interface),
+                        self.cmd_default_int_snippet % interface)
+            builder.add('interface {} channel-group {} mode active'.format(interface, pc),
+                        self.cmd_config_pc_trunk % (interface, pc))
+
+        builder.add('interface port-channel{0} vpc {0}'.format(pc),
+                    self.cmd_config_vpc_member % (pc, pc))
+        try:
+            # one edit_config for the members and the vpc, raises ConfigError
+            builder.apply(self._edit_config)
+        finally:
+            # port-channel membership changed, next read must hit the device
+            self.invalidate('port_channel_dict', 'vpc_dict')
         status = True
         return status
 
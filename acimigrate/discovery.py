@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+import threading
+import time
+import logging
+from acimigrate.Devices import Nexus, APIC
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for a single device to connect and answer its queries
+DISCOVERY_TIMEOUT = 120
+
+
+class DiscoveryError(Exception):
+    """
+    Raised when one or more devices fail or time out during discovery
+    """
+
+    def __init__(self, errors):
+        self.errors = errors
+        super(DiscoveryError, self).__init__(
+            '; '.join('{}: {}'.format(k, v) for k, v in sorted(errors.items())))
+
+
+def run_parallel(calls, timeout=DISCOVERY_TIMEOUT):
+    """
+    Runs each callable on its own thread and waits for all of them
+
+    :param calls: dict of name -> callable
+    :param timeout: float seconds allowed for each call
+    :return: dict of name -> return value
+    """
+    results = {}
+    errors = {}
+    threads = {}
+
+    def run(name, func):
+        start = time.time()
+        try:
+            results[name] = func()
+        except Exception as e:
+            logger.error('Discovery of {} failed: {}'.format(name, e))
+            errors[name] = e
+        logger.info('Discovery of {} took {:.2f}s'.format(name, time.time() - start))
+
+    for name, func in calls.items():
+        thread = threading.Thread(target=run, args=(name, func),
+                                  name='acimigrate-discovery-{}'.format(name))
+        # a hung device must not keep the process alive
+        thread.daemon = True
+        thread.start()
+        threads[name] = thread
+
+    # all threads started together, so each gets the same deadline
+    deadline = time.time() + timeout
+    for name, thread in threads.items():
+        thread.join(max(0, deadline - time.time()))
+        if thread.is_alive():
+            errors[name] = 'timed out after {}s'.format(timeout)
+
+    if errors:
+        raise DiscoveryError(errors)
+    return results
+
+
+def discover_nexus(host, username, password, migration=False):
+    """
+    Connects to a Nexus and reads the tables the migration wizard needs
+    :return: dict
+    """
+    nexus = Nexus(host, username, password)
+    result = {'device': nexus,
+              'free_interfaces': nexus.free_interfaces()}
+    if migration:
+        result['migration_dict'] = nexus.migration_dict()
+    return result
+
+
+def discover_apic(url, username, password):
+    """
+    Logs in to the APIC and lists the leaves, their interfaces are loaded
+    once the user picks them
+    :return: dict
+    """
+    apic = APIC(url, username, password)
+    return {'device': apic,
+            'aci_switch_dict': apic.list_leaves()}
+
+
+def discover(args, timeout=DISCOVERY_TIMEOUT):
+    """
+    Discovers both Nexus peers and the APIC concurrently, so the wait is
+    bounded by the slowest device rather than the sum of all three
+
+    :param args: dict of the credentials posted by the setup form
+    :param timeout: float seconds allowed per device
+    :return: dict of 'nexus', 'nexus2' and 'apic' discovery results
+    """
+    return run_parallel({
+        'nexus': lambda: discover_nexus(args['nexus_hostname'],
+                                        args['nexus_username'],
+                                        args['nexus_password'],
+                                        migration=True),
+        'nexus2': lambda: discover_nexus(args['nexus2_hostname'],
+                                         args['nexus2_username'],
+                                         args['nexus2_password']),
+        'apic': lambda: discover_apic(args['apic_url'],
+                                      args['apic_username'],
+                                      args['apic_password']),
+    }, timeout=timeout)
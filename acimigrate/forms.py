@@ -23,6 +23,7 @@ class MigrationForm(Form):
     tenant_name = StringField('tenant')
     app_name = StringField('app')
     layer3 = BooleanField('layer3')
+    delete_stale = BooleanField('delete_stale')
     n1i1 = StringField('n1i1')
     n1i2 = StringField('n1i2')
     n2i1 = StringField('n2i1')
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+"""
+Resolves the BD gateways of a layer 3 migration: every HSRP VIP is matched
+to the SVI subnet containing it, once, over the whole discovery model
+"""
+import bisect
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SubnetIndex(object):
+    """
+    Interval index over the SVI subnets of every vlan.  Subnets are sorted
+    by first address and a running maximum of last addresses bounds the
+    walk back, so a lookup is a bisect plus the few subnets overlapping
+    the address.
+    """
+
+    def __init__(self, model):
+        """
+        :param model: model.DiscoveryModel
+        """
+        entries = []
+        for record in model:
+            for network in record.subnets:
+                entries.append((int(network.network_address), -network.prefixlen,
+                                int(network.broadcast_address), record.vid, network))
+        entries.sort()
+        self.starts = [e[0] for e in entries]
+        self.entries = entries
+        self.max_end = []
+        end = -1
+        for e in entries:
+            end = max(end, e[2])
+            self.max_end.append(end)
+
+    def find(self, address):
+        """
+        :param address: ipaddress.IPv4Address
+        :return: list of (vid, network) containing address, most specific first
+        """
+        addr = int(address)
+        found = []
+        j = bisect.bisect_right(self.starts, addr) - 1
+        while j >= 0 and self.max_end[j] >= addr:
+            start, prefix, end, vid, network = self.entries[j]
+            if end >= addr:
+                found.append((vid, network))
+            j -= 1
+        found.sort(key=lambda f: -f[1].prefixlen)
+        return found
+
+
+class Mismatch(object):
+    """
+    A VIP that could not be placed in a subnet of its own vlan
+    """
+    __slots__ = ('vid', 'vip', 'reason')
+
+    def __init__(self, vid, vip, reason):
+        self.vid = vid
+        self.vip = vip
+        self.reason = reason
+
+    def __str__(self):
+        return 'vlan {} VIP {}: {}'.format(self.vid, self.vip, self.reason)
+
+
+def resolve_gateways(model):
+    """
+    Matches every HSRP VIP to the primary or secondary subnet containing it
+
+    :param model: model.DiscoveryModel
+    :return: (dict of vid -> list of str gateways e.g. 10.1.1.1/24,
+              list of Mismatch)
+    """
+    index = SubnetIndex(model)
+    gateways = {}
+    mismatches = []
+    for record in model.l3():
+        nets = []
+        for vip in record.vips:
+            matches = index.find(vip)
+            own = [network for vid, network in matches if vid == record.vid]
+            if own:
+                nets.append('{}/{}'.format(vip, own[0].prefixlen))
+            elif matches:
+                others = ', '.join('{} on vlan {}'.format(network, vid) for vid, network in matches)
+                mismatches.append(Mismatch(record.vid, vip, 'only in {}'.format(others)))
+            else:
+                mismatches.append(Mismatch(record.vid, vip, 'not in any SVI subnet'))
+        if nets:
+            gateways[record.vid] = nets
+    for record in model:
+        if record.hsrp and not record.l3:
+            mismatches.append(Mismatch(record.vid, ', '.join(str(v) for v in record.vips),
+                                       'HSRP without SVI addressing'))
+    for mismatch in mismatches:
+        logger.warning('Gateway mismatch {}'.format(mismatch))
+    return gateways, mismatches
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+from collections import namedtuple
+import re
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# The l1PhysIf attributes the migration wizard uses
+PhysIf = namedtuple('PhysIf', ['pod', 'node', 'id', 'dn'])
+# The fabricNode attributes the migration wizard uses
+Switch = namedtuple('Switch', ['pod', 'node', 'name', 'role', 'dn'])
+
+NODE_DN_RE = re.compile(r'topology/pod-(\d+)/node-(\d+)')
+
+
+def switch_from_attributes(attributes):
+    """
+    Builds a Switch from the attributes of a fabricNode MO
+    :param attributes: dict
+    :return: Switch
+    """
+    dn = attributes['dn']
+    match = NODE_DN_RE.match(dn)
+    pod = match.group(1) if match else None
+    return Switch(pod, attributes['id'], attributes['name'], attributes['role'], dn)
+
+
+def physif_from_attributes(attributes):
+    """
+    Builds a PhysIf from the attributes of an l1PhysIf MO
+    :param attributes: dict
+    :return: PhysIf
+    """
+    dn = attributes['dn']
+    match = NODE_DN_RE.match(dn)
+    pod, node = match.groups() if match else (None, None)
+    return PhysIf(pod, node, attributes['id'], dn)
+
+
+def interface_id(interface):
+    """
+    :param interface: PhysIf
+    :return: str interface id e.g. eth1/5
+    """
+    return interface.id
+
+
+class FabricInventory(object):
+    """
+    Fabric interfaces indexed by node, by (node, interface id) and by pod.
+    When given a loader, nodes are fetched the first time they are looked
+    up.  The lists handed out are the inventory's own, callers must not
+    modify them.
+    """
+
+    def __init__(self, interfaces=(), loader=None):
+        """
+        :param interfaces: iterable of PhysIf to start with
+        :param loader: callable(node) returning the PhysIf list of a node
+        """
+        self.loader = loader
+        self._lock = threading.Lock()
+        self._by_node = {}
+        self._ids_by_node = {}
+        self._by_id = {}
+        self._by_pod = {}
+        self.load(interfaces)
+
+    def load(self, interfaces):
+        """
+        Rebuilds the whole inventory
+        :param interfaces: iterable of PhysIf
+        """
+        by_node = {}
+        for interface in interfaces:
+            by_node.setdefault(str(interface.node), []).append(interface)
+        with self._lock:
+            self._by_node = {}
+            self._ids_by_node = {}
+            self._by_id = {}
+            self._by_pod = {}
+            for node, node_interfaces in by_node.items():
+                self._index(node, node_interfaces)
+
+    def _index(self, node, interfaces):
+        pod = str(interfaces[0].pod) if interfaces else None
+        self._by_node[node] = interfaces
+        self._ids_by_node[node] = [interface_id(i) for i in interfaces]
+        for interface in interfaces:
+            self._by_id[(node, interface_id(interface))] = interface
+        if pod is not None:
+            self._by_pod.setdefault(pod, set()).add(node)
+
+    def refresh_node(self, node, interfaces):
+        """
+        Replaces the interfaces of a single node
+        :param node: str node id
+        :param interfaces: list of PhysIf
+        """
+        node = str(node)
+        with self._lock:
+            for interface_key in self._ids_by_node.get(node, []):
+                self._by_id.pop((node, interface_key), None)
+            for nodes in self._by_pod.values():
+                nodes.discard(node)
+            self._index(node, list(interfaces))
+
+    def _ensure(self, node):
+        node = str(node)
+        if node not in self._by_node and self.loader is not None:
+            logger.info('Loading interfaces of node {}'.format(node))
+            self.refresh_node(node, self.loader(node))
+        return node
+
+    def interfaces(self, node):
+        """
+        :param node: str node id
+        :return: list of PhysIf on the node
+        """
+        return self._by_node.get(self._ensure(node), [])
+
+    def interface_ids(self, node):
+        """
+        :param node: str node id
+        :return: list of str interface ids on the node
+        """
+        return self._ids_by_node.get(self._ensure(node), [])
+
+    def get(self, node, interface):
+        """
+        :param node: str node id
+        :param interface: str interface id e.g. eth1/5
+        :return: PhysIf or None
+        """
+        return self._by_id.get((self._ensure(node), interface))
+
+    def nodes(self, pod=None):
+        """
+        Nodes loaded so far
+        :param pod: str pod id, all pods if None
+        :return: list of str node ids
+        """
+        if pod is None:
+            return self._by_node.keys()
+        return list(self._by_pod.get(str(pod), ()))
+
+    def __contains__(self, node):
+        return str(node) in self._by_node
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+from collections import OrderedDict
+import Queue
+import threading
+import time
+import traceback
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Number of migrations that can run at the same time.  Jobs share the
+# configured APIC and Nexus objects, which hold per-run state (tenant,
+# migration leaves, the reconciling session), so they run one at a time
+JOB_WORKERS = 1
+# Number of finished jobs kept for later retrieval
+JOB_HISTORY = 50
+
+
+class Job(object):
+    """
+    A unit of background work along with the progress events it emits
+    """
+
+    def __init__(self, name, func, args, kwargs):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.state = 'queued'
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.events = []
+        self._cond = threading.Condition()
+
+    @property
+    def done(self):
+        return self.state in ('completed', 'failed')
+
+    def progress(self, step, item=None, status=None, elapsed=None):
+        """
+        Records a progress event, passed to the job function as ``progress``
+        :param step: str migration step e.g. epg
+        :param item: str object the step acted on e.g. vlan name
+        :param status: str outcome of the step
+        :param elapsed: float seconds the step took
+        """
+        with self._cond:
+            event = {'seq': len(self.events),
+                     'time': time.time(),
+                     'step': step,
+                     'item': item,
+                     'status': status,
+                     'elapsed': elapsed}
+            self.events.append(event)
+            self._cond.notify_all()
+
+    def events_since(self, seq=0, timeout=None):
+        """
+        Returns the events after seq, waiting up to timeout seconds for new
+        ones when there are none yet
+        :param seq: int number of events already seen
+        :param timeout: float seconds
+        :return: list of event dicts
+        """
+        with self._cond:
+            if timeout and len(self.events) <= seq and not self.done:
+                self._cond.wait(timeout)
+            return self.events[seq:]
+
+    def run(self):
+        with self._cond:
+            self.state = 'running'
+            self.started = time.time()
+        try:
+            result = self.func(*self.args, progress=self.progress, **self.kwargs)
+            state = 'completed'
+        except Exception as e:
+            logger.error('Job {} failed: {}'.format(self.id, traceback.format_exc()))
+            result = None
+            self.error = str(e)
+            state = 'failed'
+        with self._cond:
+            self.result = result
+            self.state = state
+            self.finished = time.time()
+            self._cond.notify_all()
+
+    def to_dict(self, seq=0):
+        elapsed = None
+        if self.started:
+            elapsed = (self.finished or time.time()) - self.started
+        return {'id': self.id,
+                'name': self.name,
+                'state': self.state,
+                'created': self.created,
+                'elapsed': elapsed,
+                'error': self.error,
+                'result': self.result,
+                'events': self.events[seq:]}
+
+
+class JobManager(object):
+    """
+    Runs jobs on a pool of worker threads and keeps the most recent ones
+    """
+
+    def __init__(self, workers=JOB_WORKERS, history=JOB_HISTORY):
+        self.history = history
+        self.jobs = OrderedDict()
+        self._queue = Queue.Queue()
+        self._lock = threading.Lock()
+        self._workers = []
+        for n in range(workers):
+            worker = threading.Thread(target=self._work, name='acimigrate-job-{}'.format(n))
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            try:
+                job.run()
+            finally:
+                self._queue.task_done()
+
+    def submit(self, name, func, *args, **kwargs):
+        """
+        Queues func to run in the background, func must accept a
+        ``progress`` keyword argument
+        :param name: str description of the job
+        :return: Job
+        """
+        job = Job(name, func, args, kwargs)
+        with self._lock:
+            self.jobs[job.id] = job
+            self._prune()
+        logger.info('Queued job {} ({})'.format(job.id, name))
+        self._queue.put(job)
+        return job
+
+    def get(self, job_id):
+        """
+        :param job_id: str
+        :return: Job or None
+        """
+        return self.jobs.get(job_id)
+
+    def _prune(self):
+        finished = [j for j in self.jobs.values() if j.done]
+        for job in finished[:max(0, len(finished) - self.history)]:
+            del self.jobs[job.id]
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+"""
+Durable record of migration progress, kept in SQLite so a migration
+interrupted by a crash or timeout can be resumed from its last committed
+step.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Journal database, next to the package unless ACIMIGRATE_JOURNAL is set
+JOURNAL_PATH = os.environ.get('ACIMIGRATE_JOURNAL',
+                              os.path.join(os.path.dirname(os.path.abspath(__file__)), 'acimigrate-journal.db'))
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS migrations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL,
+    state TEXT NOT NULL,
+    started REAL NOT NULL,
+    finished REAL,
+    params TEXT
+);
+CREATE INDEX IF NOT EXISTS migrations_key ON migrations (key, state);
+CREATE TABLE IF NOT EXISTS steps (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    migration INTEGER NOT NULL REFERENCES migrations (id),
+    step TEXT NOT NULL,
+    item TEXT,
+    status TEXT,
+    elapsed REAL,
+    recorded REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS steps_migration ON steps (migration, step);
+CREATE TABLE IF NOT EXISTS state (
+    migration INTEGER NOT NULL REFERENCES migrations (id),
+    name TEXT NOT NULL,
+    value TEXT,
+    PRIMARY KEY (migration, name)
+);
+'''
+
+
+def committed_status(status):
+    """
+    :return: bool the step went through and need not be repeated
+    """
+    return status is not None and not status.startswith('FAILED') and status != 'SKIPPED'
+
+
+class Journal(object):
+    """
+    SQLite journal shared by every migration job in the process, each write
+    is committed before the step it records is reported
+    """
+
+    def __init__(self, path=JOURNAL_PATH):
+        self.path = path
+        self._db = None
+        self._lock = threading.Lock()
+
+    def _execute(self, sql, args=()):
+        with self._lock:
+            if self._db is None:
+                self._db = sqlite3.connect(self.path, check_same_thread=False)
+                self._db.executescript(SCHEMA)
+            with self._db:
+                cursor = self._db.execute(sql, args)
+                return cursor.lastrowid, cursor.fetchall()
+
+    def begin(self, key, params=None, resume=True):
+        """
+        Starts a migration, or resumes the last unfinished one with the same key
+
+        :param key: str identifies the migration e.g. tenant/app/nexus/nexus2
+        :param params: dict stored with the migration
+        :param resume: bool pick up an unfinished migration
+        :return: JournalRun
+        """
+        if resume:
+            lastrowid, rows = self._execute('SELECT id FROM migrations WHERE key = ? AND state != ? '
+                                            'ORDER BY id DESC LIMIT 1', (key, 'completed'))
+            if rows:
+                migration = rows[0][0]
+                logger.info('Resuming migration {} ({})'.format(migration, key))
+                self._execute('UPDATE migrations SET state = ?, finished = NULL WHERE id = ?',
+                              ('running', migration))
+                return JournalRun(self, migration, key, resumed=True)
+        migration, rows = self._execute('INSERT INTO migrations (key, state, started, params) '
+                                        'VALUES (?, ?, ?, ?)',
+                                        (key, 'running', time.time(), json.dumps(params or {})))
+        return JournalRun(self, migration, key)
+
+    def migrations(self, state=None):
+        """
+        :param state: str only migrations in this state e.g. running
+        :return: list of dicts, newest first
+        """
+        sql = 'SELECT id, key, state, started, finished FROM migrations'
+        args = ()
+        if state is not None:
+            sql += ' WHERE state = ?'
+            args = (state,)
+        lastrowid, rows = self._execute(sql + ' ORDER BY id DESC', args)
+        return [dict(zip(('id', 'key', 'state', 'started', 'finished'), row)) for row in rows]
+
+
+class JournalRun(object):
+    """
+    The journal of one migration
+    """
+
+    def __init__(self, journal, migration, key, resumed=False):
+        self.journal = journal
+        self.id = migration
+        self.key = key
+        self.resumed = resumed
+
+    def record(self, step, item=None, status=None, elapsed=None):
+        self.journal._execute('INSERT INTO steps (migration, step, item, status, elapsed, recorded) '
+                              'VALUES (?, ?, ?, ?, ?, ?)',
+                              (self.id, step, None if item is None else str(item), status, elapsed, time.time()))
+
+    def steps(self):
+        """
+        :return: list of (step, item, status, elapsed) in the order recorded
+        """
+        lastrowid, rows = self.journal._execute('SELECT step, item, status, elapsed FROM steps '
+                                                'WHERE migration = ? ORDER BY seq', (self.id,))
+        return rows
+
+    def committed(self, step):
+        """
+        :return: dict of item -> status for the items of step that went through
+        """
+        lastrowid, rows = self.journal._execute('SELECT item, status FROM steps '
+                                                'WHERE migration = ? AND step = ? ORDER BY seq',
+                                                (self.id, step))
+        latest = dict(rows)
+        return dict((item, status) for item, status in latest.items() if committed_status(status))
+
+    def get(self, name, default=None):
+        lastrowid, rows = self.journal._execute('SELECT value FROM state WHERE migration = ? AND name = ?',
+                                                (self.id, name))
+        if not rows:
+            return default
+        return json.loads(rows[0][0])
+
+    def set(self, name, value):
+        self.journal._execute('INSERT OR REPLACE INTO state (migration, name, value) VALUES (?, ?, ?)',
+                              (self.id, name, json.dumps(value)))
+
+    def finish(self, state):
+        """
+        :param state: str completed or failed
+        """
+        self.journal._execute('UPDATE migrations SET state = ?, finished = ? WHERE id = ?',
+                              (state, time.time(), self.id))
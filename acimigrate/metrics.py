@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+"""
+Timing instrumentation for every device RPC, rendered in the Prometheus
+text exposition format at /metrics
+"""
+from contextlib import contextmanager
+import bisect
+import sys
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BYTE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# Frames skipped when naming the function that issued an RPC
+PLUMBING_MODULES = ('acimigrate.metrics', 'acimigrate.sessions', 'acimigrate.query',
+                    'acimigrate.snapshot', 'acimigrate.scheduler', 'acimigrate.reconcile')
+PLUMBING_FUNCTIONS = ('<lambda>', 'rpc', '_get', '_edit_config', '_push', 'with_retry')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, _escape(v)) for k, v in pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(object):
+
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.series = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        try:
+            return tuple(str(labels[name]) for name in self.labels)
+        except KeyError as e:
+            raise ValueError('{} needs label {}'.format(self.name, e))
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.help),
+                 '# TYPE {} {}'.format(self.name, self.kind)]
+        with self._lock:
+            series = sorted(self.series.items())
+        for key, value in series:
+            lines.extend(self._samples(key, value))
+        return lines
+
+
+class Counter(Metric):
+
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self.series[key] = self.series.get(key, 0) + amount
+
+    def _samples(self, key, value):
+        return ['{}{} {}'.format(self.name, _labels(self.labels, key), _number(value))]
+
+
+class Histogram(Metric):
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super(Histogram, self).__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.series.get(key)
+            if series is None:
+                # per bucket counts, the last one is +Inf, then the sum
+                series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def _samples(self, key, value):
+        counts, total = value
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            lines.append('{}_bucket{} {}'.format(self.name,
+                                                 _labels(self.labels, key, [('le', _number(bound))]),
+                                                 cumulative))
+        lines.append('{}_sum{} {}'.format(self.name, _labels(self.labels, key), _number(total)))
+        lines.append('{}_count{} {}'.format(self.name, _labels(self.labels, key), cumulative))
+        return lines
+
+
+class Registry(object):
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """
+        :return: str Prometheus text exposition format
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+# Shared by every device in the process
+registry = Registry()
+RPC_SECONDS = registry.register(Histogram('acimigrate_rpc_seconds',
+                                          'Device RPC latency in seconds',
+                                          ('device', 'operation', 'caller')))
+RPC_BYTES = registry.register(Histogram('acimigrate_rpc_bytes',
+                                        'Device RPC payload size in bytes',
+                                        ('device', 'operation', 'direction'),
+                                        buckets=BYTE_BUCKETS))
+RPC_TOTAL = registry.register(Counter('acimigrate_rpc_total',
+                                      'Device RPCs by response status',
+                                      ('device', 'operation', 'status')))
+TABLE_SECONDS = registry.register(Histogram('acimigrate_table_seconds',
+                                            'Time to read and parse a Nexus show table, RPC included',
+                                            ('table',)))
+
+
+def caller():
+    """
+    :return: str name of the acimigrate function that issued the RPC
+    """
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        name = frame.f_code.co_name
+        if (module.startswith('acimigrate') and module not in PLUMBING_MODULES and
+                name not in PLUMBING_FUNCTIONS):
+            return name
+        frame = frame.f_back
+    return 'unknown'
+
+
+def observe(device, operation, elapsed, status, sent=0, received=0, function=None):
+    """
+    Records one RPC
+    """
+    RPC_SECONDS.observe(elapsed, device=device, operation=operation, caller=function or caller())
+    RPC_BYTES.observe(sent, device=device, operation=operation, direction='sent')
+    RPC_BYTES.observe(received, device=device, operation=operation, direction='received')
+    RPC_TOTAL.inc(device=device, operation=operation, status=status)
+
+
+@contextmanager
+def timed_table(name):
+    """
+    Times the read and parse of a show-command table
+    """
+    start = time.time()
+    try:
+        yield
+    finally:
+        TABLE_SECONDS.observe(time.time() - start, table=name)
+
+
+def timed_http(device, operation, call):
+    """
+    Runs an APIC request and records it
+    :param call: callable returning a requests response
+    :return: the response
+    """
+    function = caller()
+    start = time.time()
+    try:
+        resp = call()
+    except Exception as e:
+        observe(device, operation, time.time() - start, type(e).__name__, function=function)
+        raise
+    request = getattr(resp, 'request', None)
+    sent = len(getattr(request, 'body', None) or '')
+    observe(device, operation, time.time() - start, resp.status_code,
+            sent=sent, received=len(resp.content or ''), function=function)
+    return resp
+
+
+class InstrumentedManager(object):
+    """
+    Wraps an ncclient manager so every get and edit_config is recorded,
+    anything else is delegated
+    """
+
+    def __init__(self, manager, device):
+        self.manager = manager
+        self.device = device
+
+    def __getattr__(self, name):
+        return getattr(self.manager, name)
+
+    def _call(self, operation, sent, call):
+        function = caller()
+        start = time.time()
+        try:
+            reply = call()
+        except Exception as e:
+            observe(self.device, operation, time.time() - start, type(e).__name__,
+                    sent=sent, function=function)
+            raise
+        observe(self.device, operation, time.time() - start, 'ok',
+                sent=sent, received=len(getattr(reply, 'xml', None) or ''), function=function)
+        return reply
+
+    def get(self, filter=None, *args, **kwargs):
+        sent = len(filter[1]) if isinstance(filter, tuple) else 0
+        return self._call('get', sent, lambda: self.manager.get(filter, *args, **kwargs))
+
+    def edit_config(self, *args, **kwargs):
+        # ncclient's signature is edit_config(config, format, target, ...)
+        config = kwargs.get('config', args[0] if args else '')
+        return self._call('edit_config', len(config or ''),
+                          lambda: self.manager.edit_config(*args, **kwargs))
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+"""
+Discovery model of the vlans on a Nexus, joined once from the vlan, SVI
+and HSRP tables
+"""
+import bisect
+import re
+import ipaddress
+import logging
+
+logger = logging.getLogger(__name__)
+
+SVI_RE = re.compile(r'^Vlan(\d+)$', re.IGNORECASE)
+
+
+def svi_vlan(intf):
+    """
+    :param intf: str e.g. Vlan10
+    :return: int vlan id, None for other interfaces
+    """
+    match = SVI_RE.match(intf)
+    return int(match.group(1)) if match else None
+
+
+def index_svis(table):
+    """
+    Keys an SVI or HSRP table by int vlan id
+    :param table: dict of interface name -> row
+    :return: dict of int -> row
+    """
+    index = {}
+    for intf, row in table.items():
+        vid = svi_vlan(intf)
+        if vid is not None:
+            index[vid] = row
+    return index
+
+
+class VlanRecord(object):
+    """
+    One vlan with its gateway addressing
+    """
+    __slots__ = ('vid', 'name', 'vmac', 'vips', 'subnets')
+
+    def __init__(self, vid, name, vmac=None, vips=(), subnets=()):
+        """
+        :param vid: int vlan id
+        :param name: str vlan name
+        :param vmac: str HSRP virtual mac
+        :param vips: tuple of ipaddress.IPv4Address HSRP virtual ips
+        :param subnets: tuple of ipaddress.IPv4Network, primary first
+        """
+        self.vid = vid
+        self.name = name
+        self.vmac = vmac
+        self.vips = vips
+        self.subnets = subnets
+
+    def __repr__(self):
+        return 'VlanRecord({}, {!r})'.format(self.vid, self.name)
+
+    @property
+    def hsrp(self):
+        return bool(self.vips)
+
+    @property
+    def l3(self):
+        return bool(self.subnets)
+
+    def to_dict(self):
+        """
+        :return: dict in the Nexus.migration_dict vlan format
+        """
+        if not self.hsrp:
+            return {'name': self.name, 'hsrp': None}
+        hsrp = {'vmac': self.vmac, 'vips': [str(vip) for vip in self.vips]}
+        if self.subnets:
+            hsrp['subnets'] = [str(net.network_address) for net in self.subnets]
+            hsrp['masks'] = [str(net.prefixlen) for net in self.subnets]
+        return {'name': self.name, 'hsrp': hsrp}
+
+
+def _networks(svi):
+    nets = []
+    for subnet, mask in zip(svi['subnets'], svi['masks']):
+        try:
+            nets.append(ipaddress.ip_network(u'{}/{}'.format(subnet, mask), strict=False))
+        except ValueError:
+            logger.info('Ignoring invalid subnet {}/{}'.format(subnet, mask))
+    return tuple(nets)
+
+
+def _addresses(vips):
+    addresses = []
+    for vip in vips:
+        try:
+            addresses.append(ipaddress.ip_address(unicode(vip)))
+        except ValueError:
+            logger.info('Ignoring invalid HSRP address {}'.format(vip))
+    return tuple(addresses)
+
+
+class DiscoveryModel(object):
+    """
+    The vlans of a device ordered by id
+    """
+
+    def __init__(self, records=()):
+        self.records = sorted(records, key=lambda r: r.vid)
+        self.vids = [r.vid for r in self.records]
+        self.by_vid = dict((r.vid, r) for r in self.records)
+
+    @classmethod
+    def from_tables(cls, vlan_dict, svi_dict, hsrp_dict):
+        """
+        Joins the tables in one pass over the vlans
+
+        :param vlan_dict: dict of vlan id -> name, as Nexus.vlan_dict
+        :param svi_dict: dict of SVI -> {'subnets', 'masks'}, as Nexus.svi_dict
+        :param hsrp_dict: dict of SVI -> {'vmac', 'vips'}, as Nexus.hsrp_dict
+        """
+        svis = index_svis(svi_dict)
+        groups = index_svis(hsrp_dict)
+        records = []
+        for vid, name in vlan_dict.items():
+            vid = int(vid)
+            hsrp = groups.get(vid)
+            if hsrp is None:
+                records.append(VlanRecord(vid, name))
+                continue
+            svi = svis.get(vid)
+            records.append(VlanRecord(vid, name,
+                                      vmac=hsrp['vmac'],
+                                      vips=_addresses(hsrp['vips']),
+                                      subnets=_networks(svi) if svi else ()))
+        return cls(records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, vid):
+        return self.by_vid[int(vid)]
+
+    def __contains__(self, vid):
+        return int(vid) in self.by_vid
+
+    def l3(self):
+        """
+        :return: list of VlanRecord with an HSRP gateway and SVI subnets
+        """
+        return [r for r in self.records if r.hsrp and r.l3]
+
+    def without_hsrp(self):
+        """
+        :return: list of VlanRecord without an HSRP gateway
+        """
+        return [r for r in self.records if not r.hsrp]
+
+    def in_range(self, first, last):
+        """
+        :return: list of VlanRecord with first <= vid <= last
+        """
+        return self.records[bisect.bisect_left(self.vids, first):bisect.bisect_right(self.vids, last)]
+
+    def to_dict(self):
+        """
+        :return: dict in the Nexus.migration_dict format, keyed by str vlan id
+        """
+        return {'vlans': dict((str(r.vid), r.to_dict()) for r in self.records)}
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds for a single exec_configure document
+NETCONF_MAX_COMMANDS = 100
+NETCONF_MAX_BYTES = 64 * 1024
+
+
+class ConfigError(Exception):
+    """
+    Raised when a configuration sub-command is rejected by the device
+    """
+
+    def __init__(self, command, error, applied):
+        self.command = command
+        self.error = error
+        self.applied = applied
+        super(ConfigError, self).__init__('{} failed: {}'.format(command, error))
+
+
+class ConfigBuilder(object):
+    """
+    Collects NX-OS exec_configure snippets for a device and applies them in
+    as few edit_config RPCs as the document bounds allow.  Every snippet is
+    labelled with the CLI command it represents so a failure can be traced
+    back to it.
+    """
+
+    def __init__(self, prefix, postfix,
+                 max_commands=NETCONF_MAX_COMMANDS,
+                 max_bytes=NETCONF_MAX_BYTES):
+        self.prefix = prefix
+        self.postfix = postfix
+        self.max_commands = max_commands
+        self.max_bytes = max_bytes
+        self.commands = []
+
+    def add(self, command, snippet):
+        """
+        :param command: str CLI equivalent of the snippet, used for reporting
+        :param snippet: str exec_configure xml
+        :return: self
+        """
+        self.commands.append((command, snippet))
+        return self
+
+    def __len__(self):
+        return len(self.commands)
+
+    def wrap(self, snippets):
+        return self.prefix + ''.join(snippets) + self.postfix
+
+    def documents(self):
+        """
+        Groups the snippets into bounded exec_configure documents
+        :return: list of (str config, list of (command, snippet))
+        """
+        documents = []
+        batch = []
+        size = 0
+        for command, snippet in self.commands:
+            if batch and (len(batch) >= self.max_commands or size + len(snippet) > self.max_bytes):
+                documents.append((self.wrap(s for c, s in batch), batch))
+                batch = []
+                size = 0
+            batch.append((command, snippet))
+            size += len(snippet)
+        if batch:
+            documents.append((self.wrap(s for c, s in batch), batch))
+        return documents
+
+    def _failing_command(self, edit, batch):
+        """
+        Replays a rejected document one sub-command at a time, stopping at
+        the first one the device rejects on its own
+        :return: str the failing command, or a description of the batch when
+                 every command goes through individually
+        """
+        for command, snippet in batch:
+            try:
+                edit(self.wrap([snippet]))
+            except Exception as error:
+                logger.info('{} rejected on its own: {}'.format(command, error))
+                return command
+        return 'batch of {} commands from {} to {}'.format(len(batch), batch[0][0], batch[-1][0])
+
+    def apply(self, edit):
+        """
+        Sends every document with edit, stopping at the first document the
+        device rejects.  Its sub-commands are replayed to find the failing
+        one, which is reported in a ConfigError along with the device's
+        original error.  ConfigError.applied only lists the commands of
+        documents the device accepted.
+
+        :param edit: callable(config) sending one edit_config RPC
+        :return: list of str commands applied
+        """
+        applied = []
+        for config, batch in self.documents():
+            try:
+                edit(config)
+            except Exception as e:
+                logger.info('Batch of {} commands failed, replaying individually'.format(len(batch)))
+                raise ConfigError(self._failing_command(edit, batch), e, applied)
+            applied.extend(c for c, s in batch)
+        return applied
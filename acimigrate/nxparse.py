@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+from collections import namedtuple
+from cStringIO import StringIO
+import logging
+try:
+    import xml.etree.cElementTree as ET
+except ImportError:
+    import xml.etree.ElementTree as ET
+
+logger = logging.getLogger(__name__)
+
+
+def qname(namespace, tag):
+    """
+    :return: str tag in ElementTree {namespace}tag notation
+    """
+    return '{%s}%s' % (namespace, tag)
+
+
+def iter_rows(source, tag):
+    """
+    Incrementally parses an NX-OS reply and yields every outermost ``tag``
+    element as soon as it is complete.  Each yielded row is released once
+    the caller moves on, so memory stays flat regardless of table size;
+    do not keep references to a row past the iteration step.
+
+    :param source: str reply xml or a file-like object
+    :param tag: str row tag in {namespace}tag notation
+    :return: generator of ElementTree elements
+    """
+    for row, parent in _iter_rows(source, tag):
+        yield row
+
+
+def _iter_rows(source, tag):
+    """
+    iter_rows worker, yields (row, parent tag) pairs
+    """
+    if isinstance(source, unicode):
+        source = source.encode('utf-8')
+    if isinstance(source, str):
+        source = StringIO(source)
+
+    stack = []
+    depth = 0
+    for event, elem in ET.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            stack.append(elem)
+            if elem.tag == tag:
+                depth += 1
+            continue
+
+        stack.pop()
+        if elem.tag != tag:
+            continue
+        depth -= 1
+        if depth:
+            # nested row of the same name, it goes out with its parent
+            continue
+        parent = stack[-1] if stack else None
+        yield elem, parent.tag if parent is not None else None
+        # detach and empty the row so the parsed tree does not grow
+        if parent is not None:
+            parent.remove(elem)
+        elem.clear()
+
+
+def iter_table(source, table_tag, row_tag):
+    """
+    Like iter_rows, but only yields rows that sit directly under table_tag,
+    so the parser goes straight to the TABLE_x/ROW_x path
+    """
+    for row, parent in _iter_rows(source, row_tag):
+        if parent == table_tag:
+            yield row
+
+
+class Table(object):
+    """
+    Precompiled description of an NX-OS ``TABLE_<name>/ROW_<name>`` table.
+
+    Each field is (attribute, tag) or (attribute, tag, type).  A tag ending
+    in ``*`` collects every child starting with that prefix into a list,
+    for the numbered columns NX-OS uses e.g. subnet1, subnet2.  Nested
+    tables are given as (attribute, Table) and parse to a list of records.
+    Rows are returned as namedtuple records.
+    """
+
+    def __init__(self, namespace, name, fields, tables=()):
+        self.namespace = namespace
+        self.name = name
+        self.table_tag = qname(namespace, 'TABLE_' + name)
+        self.row_tag = qname(namespace, 'ROW_' + name)
+        self.record = namedtuple('{}Row'.format(name),
+                                 [f[0] for f in fields] + [t[0] for t in tables])
+        self._columns = {}
+        self._prefixes = []
+        self._defaults = {}
+        for field in fields:
+            attr, tag = field[0], field[1]
+            cast = field[2] if len(field) > 2 else None
+            if tag.endswith('*'):
+                self._prefixes.append((qname(namespace, tag[:-1]), attr, cast))
+                self._defaults[attr] = []
+            else:
+                self._columns[qname(namespace, tag)] = (attr, cast)
+                self._defaults[attr] = None
+        self._tables = {}
+        for attr, table in tables:
+            self._tables[table.table_tag] = (attr, table)
+            self._defaults[attr] = []
+
+    def parse(self, row):
+        """
+        Converts a ROW element to a record, looking only at its direct children
+        :param row: ElementTree element
+        :return: namedtuple record
+        """
+        values = dict((k, list(v) if isinstance(v, list) else v) for k, v in self._defaults.items())
+        for child in row:
+            tag = child.tag
+            column = self._columns.get(tag)
+            if column is not None:
+                attr, cast = column
+                values[attr] = cast(child.text) if cast and child.text is not None else child.text
+                continue
+            nested = self._tables.get(tag)
+            if nested is not None:
+                attr, table = nested
+                values[attr].extend(table.parse(r) for r in child if r.tag == table.row_tag)
+                continue
+            for prefix, attr, cast in self._prefixes:
+                if tag.startswith(prefix) and tag[len(prefix):].isdigit():
+                    values[attr].append(cast(child.text) if cast else child.text)
+                    break
+        return self.record(**values)
+
+    def rows(self, source):
+        """
+        Streams the table out of an NX-OS reply
+        :param source: str reply xml or a file-like object
+        :return: generator of namedtuple records
+        """
+        for row in iter_table(source, self.table_tag, self.row_tag):
+            yield self.parse(row)
+
+
+VLAN_NS = 'http://www.cisco.com/nxos:1.0:vlan_mgr_cli'
+PC_NS = 'http://www.cisco.com/nxos:1.0:eth_pcm_dc3'
+VPC_NS = 'http://www.cisco.com/nxos:1.0:mcecm'
+IF_NS = 'http://www.cisco.com/nxos:1.0:if_manager'
+IP_NS = 'http://www.cisco.com/nxos:1.0:ip'
+HSRP_NS = 'http://www.cisco.com/nxos:1.0:hsrp_engine'
+CDP_NS = 'http://www.cisco.com/nxos:1.0:cdpd'
+
+# show vlan
+VLAN_TABLE = Table(VLAN_NS, 'vlanbrief', [('vlanid', 'vlanshowbr-vlanid-utf'),
+                                          ('name', 'vlanshowbr-vlanname')])
+
+# show port-channel summary
+PC_TABLE = Table(PC_NS, 'channel', [('group', 'group')],
+                 tables=[('members', Table(PC_NS, 'member', [('port', 'port')]))])
+
+# show vpc
+VPC_TABLE = Table(VPC_NS, 'vpc', [('vpc_id', 'vpc-id')])
+
+# show interface status
+INTERFACE_TABLE = Table(IF_NS, 'interface', [('interface', 'interface')])
+
+# show ip interface
+SVI_TABLE = Table(IP_NS, 'intf', [('intf', 'intf-name'),
+                                  ('subnet', 'subnet'),
+                                  ('masklen', 'masklen')],
+                  tables=[('secondaries', Table(IP_NS, 'secondary_address',
+                                                [('subnets', 'subnet*'),
+                                                 ('masks', 'masklen*')]))])
+
+# show hsrp detail
+HSRP_TABLE = Table(HSRP_NS, 'grp_detail', [('intf', 'sh_if_index'),
+                                           ('vip', 'sh_vip'),
+                                           ('vmac', 'sh_vmac')],
+                   tables=[('secondaries', Table(HSRP_NS, 'grp_vip_sec',
+                                                 [('vip', 'sh_vip_sec')]))])
+
+# show cdp neighbor
+CDP_TABLE = Table(CDP_NS, 'cdp_neighbor_brief_info', [('device_id', 'device_id'),
+                                                      ('intf_id', 'intf_id'),
+                                                      ('port_id', 'port_id'),
+                                                      ('platform_id', 'platform_id')])
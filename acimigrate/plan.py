@@ -0,0 +1,327 @@
+#!/usr/bin/env python
+"""
+Plan mode: runs the migration against recording sessions so the exact APIC
+JSON and NX-OS NETCONF documents can be inspected, counted and sized
+without pushing anything to a device.
+
+Reads are answered from canned show-command replies, or passed through to
+a live device when one is given, writes are only recorded.
+
+    python -m acimigrate.plan --nexus replies/n1 --nexus2 replies/n2 \\
+        --leaf leaf-101:eth1/1,eth1/2 --leaf leaf-102:eth1/1 \\
+        --n1-int Ethernet1/1 --n2-int Ethernet1/1 --output plan.json
+"""
+from contextlib import contextmanager
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+import time
+import logging
+from acimigrate.Devices import APIC, Nexus
+from acimigrate.tasks import migrate
+
+logger = logging.getLogger(__name__)
+
+# Credentials given to the planned devices, nothing logs in with them
+PLAN_USER = 'plan'
+PLAN_PASSWORD = 'plan'
+# Node ids handed out for leaves without one in the plan
+PLAN_FIRST_NODE_ID = 101
+
+EMPTY_REPLY = ('<?xml version="1.0" encoding="ISO-8859-1"?>\n'
+               '<rpc-reply xmlns="urn:ietf:params:xml:ns:netconf:base:1.0" message-id="1">'
+               '<data/></rpc-reply>')
+OK_REPLY = ('<?xml version="1.0" encoding="ISO-8859-1"?>\n'
+            '<rpc-reply xmlns="urn:ietf:params:xml:ns:netconf:base:1.0" message-id="1">'
+            '<ok/></rpc-reply>')
+
+NODE_NAME_RE = re.compile(r'fabricNode\.name,"([^"]+)"')
+
+
+def query_command(query):
+    """
+    Names the show command of a subtree filter, used to look up canned replies
+    :param query: str e.g. <show><hsrp><detail/></hsrp></show>
+    :return: str e.g. hsrp detail
+    """
+    tags = re.findall(r'<([\w-]+)', query)
+    return ' '.join(t for t in tags if t != 'show')
+
+
+def load_replies(directory):
+    """
+    Reads canned replies from a directory, one file per show command named
+    after it e.g. hsrp-detail.xml, port-channel-summary.xml, vlan.xml
+    :return: dict of command -> reply xml
+    """
+    replies = {}
+    for filename in os.listdir(directory):
+        if not filename.endswith('.xml'):
+            continue
+        command = filename[:-len('.xml')]
+        with open(os.path.join(directory, filename)) as f:
+            replies[command] = f.read()
+            # file names can't hold spaces, port-channel keeps its dash
+            replies[command.replace('-', ' ').replace('port channel', 'port-channel')] = replies[command]
+    return replies
+
+
+def mo_counts(obj, counts=None):
+    """
+    Counts the managed objects of each class in an APIC payload
+    :return: dict of class -> int
+    """
+    if counts is None:
+        counts = {}
+    for cls, mo in obj.items():
+        counts[cls] = counts.get(cls, 0) + 1
+        for child in mo.get('children', []):
+            mo_counts(child, counts)
+    return counts
+
+
+class PlanResponse(object):
+    """
+    Stands in for a requests response
+    """
+
+    def __init__(self, body, status_code=200):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.text = json.dumps(body)
+        self._body = body
+
+    def json(self):
+        return self._body
+
+
+class RecordingSession(object):
+    """
+    APIC session that records every push.  Queries are sent to session when
+    one is given, otherwise node ids are made up and everything else is
+    reported as absent.
+    """
+
+    def __init__(self, plan, url, session=None, nodes=None):
+        self.plan = plan
+        self.url = url
+        self.session = session
+        self.nodes = dict(nodes or {})
+        self._lock = threading.Lock()
+
+    def _node_id(self, name):
+        with self._lock:
+            if name not in self.nodes:
+                self.nodes[name] = str(PLAN_FIRST_NODE_ID + len(self.nodes))
+            return self.nodes[name]
+
+    def get(self, url):
+        self.plan.record_read('apic', self.url, url)
+        if self.session is not None:
+            return self.session.get(url)
+        imdata = []
+        match = NODE_NAME_RE.search(url)
+        if match and 'page=0' in url:
+            name = match.group(1)
+            imdata.append({'fabricNode': {'attributes': {'id': self._node_id(name), 'name': name}}})
+        return PlanResponse({'totalCount': str(len(imdata)), 'imdata': imdata})
+
+    def push_to_apic(self, url, data):
+        self.plan.record_push(self.url, url, data)
+        return PlanResponse({'totalCount': '0', 'imdata': []})
+
+
+class RecordingManager(object):
+    """
+    ncclient manager that records every edit_config.  Gets are answered
+    from replies, a dict of show command -> reply xml, or sent to manager
+    when one is given.
+    """
+
+    connected = True
+
+    def __init__(self, plan, host, replies=None, manager=None):
+        self.plan = plan
+        self.host = host
+        self.replies = replies or {}
+        self.manager = manager
+
+    def get(self, filter=None):
+        query = filter[1]
+        self.plan.record_read('netconf', self.host, query)
+        if self.manager is not None:
+            return self.manager.get(filter)
+        command = query_command(query)
+        if command not in self.replies:
+            logger.info('No canned reply for "{}" on {}'.format(command, self.host))
+        return self.replies.get(command, EMPTY_REPLY)
+
+    def edit_config(self, target=None, config=None):
+        self.plan.record_edit(self.host, config)
+        return OK_REPLY
+
+    def close_session(self):
+        pass
+
+
+class PlanPool(object):
+    """
+    NetconfPool look-alike always handing out the same RecordingManager
+    """
+
+    def __init__(self, manager):
+        self.manager = manager
+
+    @contextmanager
+    def session(self, key, connect):
+        yield self.manager
+
+    def call(self, key, connect, func):
+        return func(self.manager)
+
+    def close(self, key=None):
+        pass
+
+
+class Plan(object):
+    """
+    Collects the documents a migration would send
+    """
+
+    def __init__(self):
+        self.pushes = []
+        self.edits = []
+        self.reads = {'apic': 0, 'netconf': 0}
+        self.elapsed = None
+        self._lock = threading.Lock()
+
+    def apic(self, url, session=None, nodes=None):
+        """
+        :param url: str APIC url, only used for labelling
+        :param session: optional live session used for reads
+        :param nodes: dict of leaf name -> node id
+        :return: APIC recording its pushes in this plan
+        """
+        return APIC(url, PLAN_USER, PLAN_PASSWORD,
+                    session=RecordingSession(self, url, session=session, nodes=nodes))
+
+    def nexus(self, host, replies=None, manager=None):
+        """
+        :param host: str device name, only used for labelling
+        :param replies: dict of show command -> reply xml
+        :param manager: optional live ncclient manager used for reads
+        :return: Nexus recording its edit_configs in this plan
+        """
+        return Nexus(host, PLAN_USER, PLAN_PASSWORD,
+                     pool=PlanPool(RecordingManager(self, host, replies=replies, manager=manager)))
+
+    def record_read(self, kind, device, query):
+        with self._lock:
+            self.reads[kind] += 1
+
+    def record_push(self, device, url, data):
+        with self._lock:
+            self.pushes.append({'device': device, 'url': url, 'payload': data,
+                                'bytes': len(json.dumps(data))})
+
+    def record_edit(self, device, config):
+        with self._lock:
+            self.edits.append({'device': device, 'config': config, 'bytes': len(config)})
+
+    def summary(self):
+        """
+        :return: dict of object counts, payload sizes and round trips
+        """
+        counts = {}
+        for push in self.pushes:
+            mo_counts(push['payload'], counts)
+        devices = {}
+        for edit in self.edits:
+            device = devices.setdefault(edit['device'], {'documents': 0, 'bytes': 0})
+            device['documents'] += 1
+            device['bytes'] += edit['bytes']
+        return {'apic': {'posts': len(self.pushes),
+                         'queries': self.reads['apic'],
+                         'bytes': sum(p['bytes'] for p in self.pushes),
+                         'largest_post': max([p['bytes'] for p in self.pushes] or [0]),
+                         'objects': sum(counts.values()),
+                         'classes': counts},
+                'netconf': {'edit_configs': len(self.edits),
+                            'gets': self.reads['netconf'],
+                            'bytes': sum(e['bytes'] for e in self.edits),
+                            'devices': devices},
+                'elapsed': self.elapsed}
+
+    def estimate(self, apic_latency=0.2, netconf_latency=0.5):
+        """
+        Runtime if every round trip ran one after another, an upper bound
+        since APIC pushes are scheduled in parallel
+        :param apic_latency: float seconds per APIC request
+        :param netconf_latency: float seconds per NETCONF RPC
+        :return: float seconds
+        """
+        return ((len(self.pushes) + self.reads['apic']) * apic_latency +
+                (len(self.edits) + self.reads['netconf']) * netconf_latency)
+
+    def to_dict(self):
+        return {'summary': self.summary(),
+                'apic': self.pushes,
+                'netconf': self.edits}
+
+
+def plan_migration(plan, nx, apic, nx2, tenant_name, app_name, **kwargs):
+    """
+    Runs the whole migration against devices built by plan.apic and
+    plan.nexus, the same steps as a migration job
+
+    :return: dict migration result
+    """
+    start = time.time()
+    apic.migration_tenant(tenant_name, app_name)
+    result = migrate(nx, apic, nx2, auto=True, **kwargs)
+    plan.elapsed = time.time() - start
+    return result
+
+
+def _leaf(value):
+    name, ports = value.split(':', 1)
+    return name, [[p] for p in ports.split(',')]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render the migration without touching any device')
+    parser.add_argument('--nexus', required=True, help='directory of canned replies for the first Nexus')
+    parser.add_argument('--nexus2', required=True, help='directory of canned replies for the vpc peer')
+    parser.add_argument('--leaf', action='append', type=_leaf, default=[],
+                        help='leaf and its migration ports e.g. leaf-101:eth1/1,eth1/2')
+    parser.add_argument('--n1-int', action='append', default=[], help='first Nexus uplink interface')
+    parser.add_argument('--n2-int', action='append', default=[], help='vpc peer uplink interface')
+    parser.add_argument('--tenant', default='migration')
+    parser.add_argument('--app', default='migration')
+    parser.add_argument('--layer3', action='store_true')
+    parser.add_argument('--output', help='write every document as json to this file')
+    args = parser.parse_args(argv)
+
+    plan = Plan()
+    nx = plan.nexus('nexus', replies=load_replies(args.nexus))
+    nx2 = plan.nexus('nexus2', replies=load_replies(args.nexus2))
+    apic = plan.apic('apic')
+    plan_migration(plan, nx, apic, nx2, args.tenant, args.app,
+                   layer3=args.layer3,
+                   n1_int_list=args.n1_int,
+                   n2_int_list=args.n2_int,
+                   aci_interface_dict=dict(args.leaf))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(plan.to_dict(), f, indent=2)
+    summary = plan.summary()
+    summary['estimated_seconds'] = plan.estimate()
+    json.dump(summary, sys.stdout, indent=2, sort_keys=True)
+    print
+
+
+if __name__ == '__main__':
+    main()
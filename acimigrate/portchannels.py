@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""
+Allocates port-channel numbers that are free on both vpc peers
+"""
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Port-channel and vpc numbers accepted by NX-OS
+PC_MIN = 1
+PC_MAX = 4096
+
+
+def used_ids(nexus):
+    """
+    Port-channel and vpc ids in use on a device, read from its discovery
+    snapshot rather than fresh NETCONF queries
+    :param nexus: Devices.Nexus
+    :return: set of int
+    """
+    ids = set()
+    for pc in list(nexus.pc_list()) + list(nexus.vpc_dict['vpc_list']):
+        try:
+            ids.add(int(pc))
+        except (TypeError, ValueError):
+            logger.info('Ignoring port-channel id {!r} on {}'.format(pc, nexus.host))
+    return ids
+
+
+class PortChannelAllocator(object):
+    """
+    Bitmap of the port-channel and vpc ids used on any of the devices, bit n
+    set meaning id n is taken.  The lowest free id is found with a couple of
+    bit operations on the map rather than by probing ids.
+    """
+
+    def __init__(self, used=(), first=PC_MIN, last=PC_MAX):
+        self.first = first
+        self.last = last
+        # ids outside first..last are marked used so they are never handed out
+        self.used = (1 << first) - 1
+        for pc in used:
+            self.used |= 1 << pc
+        self.full = (1 << (last + 1)) - 1
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_devices(cls, *devices):
+        """
+        :param devices: Devices.Nexus e.g. both vpc peers
+        """
+        used = set()
+        for device in devices:
+            used |= used_ids(device)
+        return cls(used)
+
+    def __contains__(self, pc):
+        return bool(self.used >> pc & 1)
+
+    def allocate(self):
+        """
+        Takes the lowest id free on every device
+        :return: int
+        :raises ValueError: when every id is taken
+        """
+        with self._lock:
+            free = ~self.used & self.full
+            if not free:
+                raise ValueError('no free port-channel id between {} and {}'.format(self.first, self.last))
+            lowest = free & -free
+            self.used |= lowest
+            return lowest.bit_length() - 1
+
+    def allocate_many(self, count):
+        """
+        Takes count ids, e.g. one per vpc migrated in the same job
+        :return: list of int
+        """
+        return [self.allocate() for n in range(count)]
+
+    def reserve(self, pc):
+        with self._lock:
+            self.used |= 1 << int(pc)
+
+    def release(self, pc):
+        if not self.first <= int(pc) <= self.last:
+            return
+        with self._lock:
+            self.used &= ~(1 << int(pc))
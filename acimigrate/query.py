@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Objects per page for APIC class and subtree queries
+APIC_PAGE_SIZE = 1000
+
+# keyword arguments accepted by the query helpers and their APIC option
+QUERY_OPTIONS = {'query_filter': 'query-target-filter',
+                 'query_target': 'query-target',
+                 'target_subtree_class': 'target-subtree-class',
+                 'rsp_subtree': 'rsp-subtree',
+                 'rsp_subtree_class': 'rsp-subtree-class',
+                 'rsp_subtree_include': 'rsp-subtree-include',
+                 'rsp_prop_include': 'rsp-prop-include',
+                 'order_by': 'order-by'}
+
+
+class QueryError(Exception):
+    """
+    Raised when the APIC rejects a query
+    """
+
+    def __init__(self, url, resp):
+        self.url = url
+        self.status_code = resp.status_code
+        super(QueryError, self).__init__('{} returned {}: {}'.format(url, resp.status_code, resp.text))
+
+
+def _options(options):
+    params = []
+    for key in sorted(options):
+        if options[key] is None:
+            continue
+        if key not in QUERY_OPTIONS:
+            raise TypeError('unknown query option {}'.format(key))
+        params.append('{}={}'.format(QUERY_OPTIONS[key], options[key]))
+    return params
+
+
+def paged(session, url, page_size=APIC_PAGE_SIZE, **options):
+    """
+    Runs an APIC query one page at a time and yields each MO, so only a
+    single page of imdata is held in memory and callers can stop early
+
+    :param session: aci.Session
+    :param url: str query url without options e.g. /api/node/class/fabricNode.json
+    :param page_size: int objects per page
+    :param options: query options, see QUERY_OPTIONS
+    :return: generator of MO dicts e.g. {'fabricNode': {'attributes': {...}}}
+    """
+    params = _options(options)
+    page = 0
+    while True:
+        page_url = '{}?{}'.format(url, '&'.join(params + ['page={}'.format(page),
+                                                          'page-size={}'.format(page_size)]))
+        resp = session.get(page_url)
+        if not resp.ok:
+            raise QueryError(page_url, resp)
+        imdata = resp.json()['imdata']
+        for mo in imdata:
+            yield mo
+        if len(imdata) < page_size:
+            return
+        page += 1
+
+
+def iter_class(session, cls, page_size=APIC_PAGE_SIZE, **options):
+    """
+    Streams every MO of a class, ordered by dn so pages are stable
+
+    :param session: aci.Session
+    :param cls: str class name e.g. l1PhysIf
+    :return: generator of MO dicts
+    """
+    options.setdefault('order_by', '{}.dn'.format(cls))
+    return paged(session, '/api/node/class/{}.json'.format(cls), page_size=page_size, **options)
+
+
+def iter_mo(session, dn, page_size=APIC_PAGE_SIZE, **options):
+    """
+    Streams the result of a query on a dn, e.g. query_target='subtree'.
+    When target_subtree_class is given the results are ordered by dn so
+    pages are stable, without it the APIC has no class to order by
+
+    :param session: aci.Session
+    :param dn: str e.g. uni/tn-common
+    :return: generator of MO dicts
+    """
+    if options.get('target_subtree_class'):
+        options.setdefault('order_by', ','.join('{}.dn'.format(cls) for cls in
+                                                options['target_subtree_class'].split(',')))
+    return paged(session, '/api/node/mo/{}.json'.format(dn), page_size=page_size, **options)
+
+
+def attributes(mo):
+    """
+    :param mo: dict MO as returned by the APIC
+    :return: dict attributes of the MO
+    """
+    return mo.values()[0]['attributes']
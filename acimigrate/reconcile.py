@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+"""
+Diff based pushes: the objects the migration owns are read from the APIC
+in a few subtree queries, and every push is pruned down to the objects
+that are missing or differ, so re-running a migration only sends what
+changed.
+"""
+import json
+import re
+import threading
+import logging
+from acimigrate.query import iter_mo, attributes
+
+logger = logging.getLogger(__name__)
+
+# Relative names of the classes the migration pushes, filled from attributes
+RN_FORMATS = {'fvTenant': 'tn-{name}',
+              'fvAp': 'ap-{name}',
+              'fvAEPg': 'epg-{name}',
+              'fvBD': 'BD-{name}',
+              'fvCtx': 'ctx-{name}',
+              'fvSubnet': 'subnet-[{ip}]',
+              'fvRsBd': 'rsbd',
+              'fvRsCtx': 'rsctx',
+              'fvRsDomAtt': 'rsdomAtt-[{tDn}]',
+              'fvRsPathAtt': 'rspathAtt-[{tDn}]',
+              'fvRsProv': 'rsprov-{tnVzBrCPName}',
+              'fvRsCons': 'rscons-{tnVzBrCPName}',
+              'vzBrCP': 'brc-{name}',
+              'vzSubj': 'subj-{name}',
+              'vzFilter': 'flt-{name}',
+              'vzEntry': 'e-{name}',
+              'vzRsSubjFiltAtt': 'rssubjFiltAtt-{tnVzFilterName}',
+              'fvnsVlanInstP': 'vlanns-[{name}]-{allocMode}',
+              'fvnsEncapBlk': 'from-[{from}]-to-[{to}]',
+              'physDomP': 'phys-{name}',
+              'infraRsVlanNs': 'rsvlanNs',
+              'infraAttEntityP': 'attentp-{name}',
+              'infraRsDomP': 'rsdomP-[{tDn}]',
+              'cdpIfPol': 'cdpIfP-{name}',
+              'lacpLagPol': 'lacplagp-{name}',
+              'fabricHIfPol': 'hintfpol-{name}',
+              'infraAccBndlGrp': 'accbundle-{name}',
+              'infraRsAttEntP': 'rsattEntP',
+              'infraRsCdpIfPol': 'rscdpIfPol',
+              'infraRsHIfPol': 'rshIfPol',
+              'infraRsLacpPol': 'rslacpPol',
+              'infraAccPortP': 'accportprof-{name}',
+              'infraHPortS': 'hports-{name}-typ-{type}',
+              'infraPortBlk': 'portblk-{name}',
+              'infraRsAccBaseGrp': 'rsaccBaseGrp',
+              'infraNodeP': 'nprof-{name}',
+              'infraRsAccPortP': 'rsaccPortP-[{tDn}]',
+              'infraLeafS': 'leaves-{name}-typ-{type}',
+              'infraNodeBlk': 'nodeblk-{name}'}
+
+# Classes read from the migration tenant and physdom
+TENANT_CLASSES = ('fvTenant', 'fvAp', 'fvAEPg', 'fvBD', 'fvCtx', 'fvSubnet',
+                  'fvRsBd', 'fvRsCtx', 'fvRsDomAtt', 'fvRsPathAtt', 'fvRsProv', 'fvRsCons',
+                  'vzBrCP', 'vzSubj', 'vzFilter', 'vzEntry', 'vzRsSubjFiltAtt')
+PHYSDOM_CLASSES = ('physDomP', 'infraRsVlanNs')
+
+# Classes read from uni/infra, the rest of the infra tree is not ours
+INFRA_CLASSES = ('fvnsVlanInstP', 'fvnsEncapBlk', 'infraAttEntityP', 'infraRsDomP',
+                 'cdpIfPol', 'lacpLagPol', 'fabricHIfPol', 'infraAccBndlGrp',
+                 'infraRsAttEntP', 'infraRsCdpIfPol', 'infraRsHIfPol', 'infraRsLacpPol',
+                 'infraAccPortP', 'infraHPortS', 'infraPortBlk', 'infraRsAccBaseGrp',
+                 'infraNodeP', 'infraRsAccPortP', 'infraLeafS', 'infraNodeBlk')
+
+# Classes removed when they exist under a pushed parent but were not pushed
+DELETE_CLASSES = ('fvAEPg', 'fvBD', 'fvSubnet', 'fvRsPathAtt', 'infraPortBlk')
+
+# Attributes that describe the push rather than the object
+IGNORED_ATTRIBUTES = ('dn', 'rn', 'status')
+
+URL_DN_RE = re.compile(r'/api/(?:node/)?mo/(.*)\.json')
+
+
+def url_dn(url):
+    """
+    :param url: str e.g. /api/mo/uni/infra.json
+    :return: str dn the url posts to e.g. uni/infra
+    """
+    return URL_DN_RE.search(url).group(1)
+
+
+def parent_of(dn):
+    """
+    Strips the last rn off a dn, slashes inside brackets are part of the
+    rn e.g. uni/tn-a/BD-b/subnet-[10.0.0.1/24] -> uni/tn-a/BD-b
+    :return: str parent dn, '' for a top level dn
+    """
+    depth = 0
+    for index in range(len(dn) - 1, -1, -1):
+        char = dn[index]
+        if char == ']':
+            depth += 1
+        elif char == '[':
+            depth -= 1
+        elif char == '/' and depth == 0:
+            return dn[:index]
+    return ''
+
+
+def mo_dn(cls, attrs, parent_dn):
+    """
+    Works out the dn of an object in a payload
+    :return: str dn, None when the class has no known rn
+    """
+    if attrs.get('dn'):
+        return attrs['dn']
+    if attrs.get('rn'):
+        return '{}/{}'.format(parent_dn, attrs['rn'])
+    if cls not in RN_FORMATS:
+        return None
+    try:
+        return '{}/{}'.format(parent_dn, RN_FORMATS[cls].format(**attrs))
+    except KeyError:
+        return None
+
+
+class ReconcileResponse(object):
+    """
+    Stands in for the APIC response when nothing needed pushing
+    """
+    status_code = 200
+    ok = True
+    text = '{"totalCount":"0","imdata":[]}'
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class ApicState(object):
+    """
+    The objects the migration owns as the APIC currently has them
+    """
+
+    def __init__(self, objects=None):
+        # dn -> (class, attributes)
+        self.objects = objects or {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, session, tenant_name, domain_name='acimigrate'):
+        """
+        Reads the tenant, the migration physdom and the migration access
+        policies in one paged subtree query each
+        """
+        queries = [('uni/tn-{}'.format(tenant_name), TENANT_CLASSES),
+                   ('uni/phys-{}'.format(domain_name), PHYSDOM_CLASSES),
+                   ('uni/infra', INFRA_CLASSES)]
+        objects = {}
+        for dn, classes in queries:
+            for mo in iter_mo(session, dn, query_target='subtree', target_subtree_class=','.join(classes)):
+                objects[attributes(mo)['dn']] = (mo.keys()[0], attributes(mo))
+        logger.info('Read {} existing objects from the APIC'.format(len(objects)))
+        return cls(objects)
+
+    def changed(self, cls, dn, attrs):
+        """
+        :return: bool the object is missing or one of attrs differs
+        """
+        if dn not in self.objects:
+            return True
+        current = self.objects[dn][1]
+        for key, value in attrs.items():
+            if key in IGNORED_ATTRIBUTES or key not in current:
+                continue
+            if str(value) != current[key]:
+                return True
+        return False
+
+    def prune(self, obj, parent_dn, seen):
+        """
+        Strips a payload down to the objects that need pushing
+
+        :param obj: dict payload e.g. {'fvTenant': {...}}
+        :param parent_dn: str dn the payload is posted under
+        :param seen: set collecting every dn in the payload
+        :return: dict pruned payload, None when nothing changed
+        """
+        cls = obj.keys()[0]
+        attrs = obj[cls].get('attributes', {})
+        dn = mo_dn(cls, attrs, parent_dn)
+        children = obj[cls].get('children', [])
+        if dn is None:
+            # unknown class, can't be compared so it is always pushed
+            return obj
+        seen.add(dn)
+        pruned = [child for child in (self.prune(c, dn, seen) for c in children) if child is not None]
+        if self.changed(cls, dn, attrs):
+            return {cls: {'attributes': attrs, 'children': pruned}}
+        if not pruned:
+            return None
+        # only the children changed, keep what identifies the parent
+        naming = dict((k, v) for k, v in attrs.items() if k in ('dn', 'name'))
+        return {cls: {'attributes': naming, 'children': pruned}}
+
+    def update(self, obj, parent_dn):
+        """
+        Records a pushed payload as the current state
+        """
+        cls = obj.keys()[0]
+        attrs = obj[cls].get('attributes', {})
+        dn = mo_dn(cls, attrs, parent_dn)
+        if dn is None:
+            return
+        with self._lock:
+            current = dict(self.objects.get(dn, (cls, {}))[1])
+            current.update((k, str(v)) for k, v in attrs.items() if k not in IGNORED_ATTRIBUTES)
+            current['dn'] = dn
+            self.objects[dn] = (cls, current)
+        for child in obj[cls].get('children', []):
+            self.update(child, dn)
+
+    def stale(self, seen, classes=DELETE_CLASSES):
+        """
+        :param seen: set of dns that were pushed
+        :return: list of (class, dn) that exist under a pushed parent but
+                 were not pushed themselves
+        """
+        stale = []
+        for dn, (cls, attrs) in sorted(self.objects.items()):
+            if cls in classes and dn not in seen and parent_of(dn) in seen:
+                stale.append((cls, dn))
+        return stale
+
+
+class ReconcilingSession(object):
+    """
+    Wraps an APIC session so every push only carries the objects that are
+    missing or differ from ApicState.  Anything else is delegated to the
+    wrapped session.
+    """
+
+    def __init__(self, session, state):
+        self.session = session
+        self.state = state
+        self.seen = set()
+        self.skipped = 0
+        self.pushed = 0
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+    def push_to_apic(self, url, data):
+        parent_dn = url_dn(url)
+        seen = set()
+        pruned = self.state.prune(data, parent_dn, seen)
+        with self._lock:
+            self.seen.update(seen)
+            if pruned is None:
+                self.skipped += 1
+        if pruned is None:
+            logger.info('{} is up to date, skipping push'.format(url))
+            return ReconcileResponse()
+        resp = self.session.push_to_apic(url, pruned)
+        if resp.ok:
+            # counted once it lands, a throttled push is retried by the caller
+            with self._lock:
+                self.pushed += 1
+            self.state.update(pruned, parent_dn)
+        return resp
+
+    def delete_stale(self, classes=DELETE_CLASSES):
+        """
+        Deletes the objects under pushed parents that the migration no
+        longer wants, e.g. the EPG of a vlan removed from the Nexus
+        :return: list of str dns deleted
+        """
+        deleted = []
+        for cls, dn in self.state.stale(self.seen, classes):
+            obj = {cls: {'attributes': {'dn': dn, 'status': 'deleted'}}}
+            resp = self.session.push_to_apic('/api/mo/{}.json'.format(dn), obj)
+            if resp.ok:
+                deleted.append(dn)
+            else:
+                logger.error('Could not delete {}: {}'.format(dn, resp.text))
+        return deleted
+
+
+def reconcile(apic, tenant_name, domain_name='acimigrate'):
+    """
+    Switches apic to diff based pushes against the current APIC state
+    :param apic: Devices.APIC
+    :return: ReconcilingSession now used by apic
+    """
+    session = apic.session
+    if isinstance(session, ReconcilingSession):
+        session = session.session
+    state = ApicState.load(session, tenant_name, domain_name)
+    apic.session = ReconcilingSession(session, state)
+    return apic.session
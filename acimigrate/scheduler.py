@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+import Queue
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Pushes run at the same time by a PushScheduler
+SCHEDULER_WORKERS = 4
+# Attempts for a throttled or failed APIC push, and the first backoff in seconds
+PUSH_RETRIES = 4
+PUSH_BACKOFF = 0.5
+# APIC responses worth retrying, it answers 429/503 when throttling
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+class PushError(Exception):
+    """
+    Raised when an APIC push fails, or when scheduled tasks fail
+    """
+
+    def __init__(self, message, resp=None, errors=None, results=None):
+        self.resp = resp
+        self.errors = errors or {}
+        self.results = results or {}
+        super(PushError, self).__init__(message)
+
+
+def with_retry(func, retries=PUSH_RETRIES, backoff=PUSH_BACKOFF):
+    """
+    Calls func until it returns a response that is not a throttling or
+    server error, backing off exponentially between attempts
+
+    :param func: callable returning a requests response
+    :return: the last response
+    """
+    delay = backoff
+    for attempt in range(retries):
+        resp = func()
+        if resp.status_code not in RETRY_STATUS or attempt == retries - 1:
+            return resp
+        logger.info('APIC returned {}, retrying in {}s'.format(resp.status_code, delay))
+        time.sleep(delay)
+        delay *= 2
+    return resp
+
+
+class Task(object):
+
+    def __init__(self, name, func, after):
+        self.name = name
+        self.func = func
+        self.after = tuple(after)
+        self.state = 'pending'
+        self.result = None
+        self.error = None
+        self.elapsed = None
+
+    def run(self):
+        start = time.time()
+        try:
+            self.result = self.func()
+            self.state = 'done'
+        except Exception as e:
+            logger.error('Task {} failed: {}'.format(self.name, e))
+            self.error = e
+            self.state = 'failed'
+        self.elapsed = time.time() - start
+
+
+class PushScheduler(object):
+    """
+    Runs APIC pushes on a bounded pool of threads, starting each one as soon
+    as the tasks it depends on have finished.  Tasks depending on a failed
+    task are skipped.
+    """
+
+    def __init__(self, workers=SCHEDULER_WORKERS, callback=None):
+        """
+        :param workers: int pushes in flight at once
+        :param callback: callable(name, status, elapsed) run as each task finishes
+        """
+        self.workers = workers
+        self.callback = callback
+        self.tasks = {}
+        self.order = []
+
+    def add(self, name, func, after=()):
+        """
+        :param name: str unique task name
+        :param func: callable doing the push, raising on failure
+        :param after: names of tasks that must finish first
+        :return: str name
+        """
+        if name in self.tasks:
+            raise ValueError('duplicate task {}'.format(name))
+        for dep in after:
+            if dep not in self.tasks:
+                raise ValueError('task {} depends on unknown task {}'.format(name, dep))
+        self.tasks[name] = Task(name, func, after)
+        self.order.append(name)
+        return name
+
+    def _worker(self, work, done):
+        while True:
+            task = work.get()
+            if task is None:
+                return
+            task.run()
+            done.put(task)
+
+    def _finish(self, task):
+        if self.callback:
+            status = 'SUCCESS' if task.state == 'done' else task.state.upper()
+            if task.error is not None:
+                status = 'FAILED: {}'.format(task.error)
+            self.callback(task.name, status, task.elapsed)
+
+    def run(self):
+        """
+        Runs every task
+        :return: dict of task name -> return value
+        """
+        waiting = dict((name, len(self.tasks[name].after)) for name in self.order)
+        dependents = dict((name, []) for name in self.order)
+        for name in self.order:
+            for dep in self.tasks[name].after:
+                dependents[dep].append(name)
+
+        work = Queue.Queue()
+        done = Queue.Queue()
+        threads = []
+        for n in range(max(1, min(self.workers, len(self.tasks)))):
+            thread = threading.Thread(target=self._worker, args=(work, done),
+                                      name='acimigrate-push-{}'.format(n))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+        for name in self.order:
+            if not waiting[name]:
+                work.put(self.tasks[name])
+
+        finished = 0
+        while finished < len(self.tasks):
+            task = done.get()
+            finished += 1
+            self._finish(task)
+            if task.state == 'done':
+                for name in dependents[task.name]:
+                    waiting[name] -= 1
+                    if not waiting[name]:
+                        work.put(self.tasks[name])
+                continue
+            # nothing that needs the failed task can run
+            skip = list(dependents[task.name])
+            while skip:
+                name = skip.pop()
+                if self.tasks[name].state != 'pending':
+                    continue
+                self.tasks[name].state = 'skipped'
+                finished += 1
+                self._finish(self.tasks[name])
+                skip.extend(dependents[name])
+
+        for thread in threads:
+            work.put(None)
+        for thread in threads:
+            thread.join()
+
+        results = dict((name, t.result) for name, t in self.tasks.items() if t.state == 'done')
+        errors = dict((name, t.error or 'skipped') for name, t in self.tasks.items() if t.state != 'done')
+        if errors:
+            raise PushError('{} of {} tasks did not complete: {}'.format(
+                len(errors), len(self.tasks), ', '.join(sorted(errors))),
+                errors=errors, results=results)
+        return results
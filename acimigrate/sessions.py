@@ -0,0 +1,359 @@
+#!/usr/bin/env python
+from contextlib import contextmanager
+import hashlib
+import threading
+import time
+import logging
+from requests.adapters import HTTPAdapter
+from ncclient.transport import TransportError
+import acitoolkit.acitoolkit as aci
+from acimigrate.metrics import InstrumentedManager, timed_http
+
+logger = logging.getLogger(__name__)
+
+# Concurrent NETCONF sessions allowed per device, NX-OS allows 8 in total
+NETCONF_MAX_SESSIONS = 2
+# Seconds between SSH keepalives on idle sessions
+NETCONF_KEEPALIVE = 30
+# Seconds a session may sit idle before it is health checked on checkout
+NETCONF_IDLE_CHECK = 60
+
+# Seconds before the APIC token expires that it is refreshed
+APIC_REFRESH_MARGIN = 60
+# Token lifetime assumed when the APIC does not report one
+APIC_TOKEN_LIFETIME = 300
+# Concurrent POSTs allowed per APIC session
+APIC_MAX_INFLIGHT = 4
+# Keep-alive HTTP connections kept per APIC
+APIC_HTTP_POOL_SIZE = 8
+
+
+def credential_key(host, port, username, password):
+    """
+    Pool key for a device, the password is only kept as a digest
+    """
+    if isinstance(password, unicode):
+        # form values are unicode, sha256 only takes bytes
+        password = password.encode('utf-8')
+    return (host, int(port), username, hashlib.sha256(password).hexdigest())
+
+
+class _DevicePool(object):
+
+    def __init__(self, max_sessions):
+        self.slots = threading.BoundedSemaphore(max_sessions)
+        self.lock = threading.Lock()
+        # credential key -> list of (manager, last used)
+        self.idle = {}
+
+
+class NetconfPool(object):
+    """
+    Keeps NETCONF sessions open between requests, keyed by host and
+    credentials.  Sessions are health checked and kept alive while idle,
+    replaced when their transport fails, and the number of concurrent
+    sessions per device is capped whichever credentials they use.
+    """
+
+    def __init__(self, max_sessions=NETCONF_MAX_SESSIONS,
+                 keepalive=NETCONF_KEEPALIVE,
+                 idle_check=NETCONF_IDLE_CHECK):
+        self.max_sessions = max_sessions
+        self.keepalive = keepalive
+        self.idle_check = idle_check
+        self._devices = {}
+        self._lock = threading.Lock()
+
+    def _device(self, key):
+        # the session limit is per device, so host and port only
+        with self._lock:
+            if key[:2] not in self._devices:
+                self._devices[key[:2]] = _DevicePool(self.max_sessions)
+            return self._devices[key[:2]]
+
+    def _healthy(self, mgr, last_used):
+        if not mgr.connected:
+            return False
+        if time.time() - last_used < self.idle_check:
+            return True
+        try:
+            # cheap round trip to prove the session still answers
+            mgr.get(('subtree', '<show><clock/></show>'))
+            return True
+        except Exception as e:
+            logger.info('Idle NETCONF session failed health check: {}'.format(e))
+            return False
+
+    def _open(self, connect):
+        mgr = connect()
+        try:
+            mgr._session._transport.set_keepalive(self.keepalive)
+        except AttributeError:
+            pass
+        return mgr
+
+    @staticmethod
+    def _close(mgr):
+        try:
+            mgr.close_session()
+        except Exception:
+            pass
+
+    @contextmanager
+    def session(self, key, connect):
+        """
+        Borrows a session for the device, opening one with connect() if no
+        healthy idle session is available.  Blocks while the device is at
+        its session limit.
+
+        :param key: tuple from credential_key
+        :param connect: callable returning a connected ncclient manager
+        """
+        device = self._device(key)
+        device.slots.acquire()
+        mgr = None
+        try:
+            while mgr is None:
+                with device.lock:
+                    idle = device.idle.get(key)
+                    if not idle:
+                        break
+                    candidate, last_used = idle.pop()
+                if self._healthy(candidate, last_used):
+                    mgr = candidate
+                else:
+                    self._close(candidate)
+            if mgr is None:
+                logger.info('Opening NETCONF session to {}'.format(key[0]))
+                mgr = self._open(connect)
+            try:
+                yield InstrumentedManager(mgr, key[0])
+            except TransportError:
+                self._close(mgr)
+                mgr = None
+                raise
+            finally:
+                if mgr is not None and mgr.connected:
+                    with device.lock:
+                        device.idle.setdefault(key, []).append((mgr, time.time()))
+        finally:
+            device.slots.release()
+
+    def call(self, key, connect, func):
+        """
+        Runs func(manager) on a pooled session, retrying once on a fresh
+        session if the transport fails
+        """
+        try:
+            with self.session(key, connect) as mgr:
+                return func(mgr)
+        except TransportError as e:
+            logger.info('NETCONF transport to {} failed ({}), reconnecting'.format(key[0], e))
+            with self.session(key, connect) as mgr:
+                return func(mgr)
+
+    def close(self, key=None):
+        """
+        Closes idle sessions, for one set of device credentials or all of
+        them
+        """
+        with self._lock:
+            if key is None:
+                devices = self._devices.values()
+            else:
+                devices = [self._devices[key[:2]]] if key[:2] in self._devices else []
+        for device in devices:
+            with device.lock:
+                if key is None:
+                    idle = [session for sessions in device.idle.values() for session in sessions]
+                    device.idle = {}
+                else:
+                    idle = device.idle.pop(key, [])
+            for mgr, last_used in idle:
+                self._close(mgr)
+
+
+# Shared by every Nexus object in the process
+netconf_pool = NetconfPool()
+
+
+class ApicLoginError(Exception):
+    """
+    Raised when the APIC rejects the credentials
+    """
+
+
+class _NoSubscriptions(object):
+    """
+    Stands in for the aci.Session subscription thread, which is only
+    created with subscriptions enabled but is exited on any failed login
+    """
+
+    def exit(self):
+        pass
+
+
+class ApicSession(object):
+    """
+    A logged in aci.Session shared between requests.  HTTP connections are
+    kept alive in a pool, and the number of POSTs in flight at once is
+    bounded.  Anything else is delegated to the underlying aci.Session.
+
+    aci.Session refreshes the token on its own login thread and logs in
+    again on a 403, replacing its requests.Session each time, so its
+    _send_login and refresh_login are wrapped to re-mount the connection
+    pool and to track when the token was last renewed.
+    """
+
+    def __init__(self, session, url, max_inflight=APIC_MAX_INFLIGHT):
+        self.session = session
+        self.url = url
+        self.inflight = threading.BoundedSemaphore(max_inflight)
+        self._lock = threading.RLock()
+        self._send_login_once = session._send_login
+        self._refresh_login_once = session.refresh_login
+        session._send_login = self._send_login
+        session.refresh_login = self._refresh_login
+        if not hasattr(session, 'subscription_thread'):
+            session.subscription_thread = _NoSubscriptions()
+        self.logged_in = None
+        self.token_lifetime = APIC_TOKEN_LIFETIME
+        try:
+            self.login()
+        except Exception:
+            self.close()
+            raise
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+    def _mount(self):
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=APIC_HTTP_POOL_SIZE)
+        self.session.session.mount('https://', adapter)
+        self.session.session.mount('http://', adapter)
+
+    def _renewed(self, resp):
+        self.logged_in = time.time()
+        try:
+            attributes = resp.json()['imdata'][0]['aaaLogin']['attributes']
+            self.token_lifetime = int(attributes['refreshTimeoutSeconds'])
+        except (ValueError, KeyError, IndexError, TypeError):
+            pass
+
+    def _send_login(self, timeout=None):
+        with self._lock:
+            resp = self._send_login_once(timeout)
+            if self.session.session is not None:
+                self._mount()
+            if resp.ok:
+                self._renewed(resp)
+            return resp
+
+    def _refresh_login(self, timeout=None):
+        with self._lock:
+            resp = self._refresh_login_once(timeout)
+            if resp.ok:
+                self._renewed(resp)
+            return resp
+
+    def login(self):
+        """
+        Logs in once, which also starts the aci.Session login thread
+        """
+        resp = self.session.login()
+        if resp is not None and not resp.ok:
+            raise ApicLoginError('Could not log in to {}: {}'.format(self.url, resp.text))
+        return resp
+
+    def close(self):
+        """
+        Stops the aci.Session login thread and closes its HTTP connections
+        """
+        self.session.login_thread.exit()
+        if self.session.session is not None:
+            self.session.close()
+
+    def _stale(self):
+        return time.time() - self.logged_in >= self.token_lifetime - APIC_REFRESH_MARGIN
+
+    def ensure_fresh(self):
+        """
+        Refreshes the token when it is about to expire, in case the login
+        thread fell behind
+        """
+        if not self._stale():
+            return
+        with self._lock:
+            if not self._stale():
+                return
+            logger.info('Refreshing APIC token for {}'.format(self.url))
+            try:
+                ok = self.session.refresh_login().ok
+            except Exception as e:
+                logger.info('APIC token refresh failed: {}'.format(e))
+                ok = False
+            if not ok:
+                self.session._send_login()
+
+    def _retry_expired(self, func):
+        self.ensure_fresh()
+        resp = func()
+        if resp.status_code == 403 and 'Token was invalid' in resp.text:
+            logger.info('APIC token expired, logging in again')
+            if not self.session._send_login().ok:
+                raise ApicLoginError('Could not log in to {} again'.format(self.url))
+            resp = func()
+        return resp
+
+    def get(self, url):
+        return self._retry_expired(lambda: timed_http(self.url, 'get', lambda: self.session.get(url)))
+
+    def push_to_apic(self, url, data):
+        with self.inflight:
+            return self._retry_expired(
+                lambda: timed_http(self.url, 'push_to_apic', lambda: self.session.push_to_apic(url, data)))
+
+
+class ApicSessionManager(object):
+    """
+    Hands out one shared ApicSession per APIC and set of credentials
+    """
+
+    def __init__(self, max_inflight=APIC_MAX_INFLIGHT):
+        self.max_inflight = max_inflight
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, url, username, password, verify_ssl=False):
+        """
+        :return: ApicSession, logged in on first use and again once the
+                 previous login was lost
+        """
+        key = credential_key(url, 0, username, password)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is not None and not session.session.logged_in():
+                logger.info('APIC session to {} is no longer logged in'.format(url))
+                self._sessions.pop(key).close()
+                session = None
+            if session is None:
+                logger.info('Logging in to APIC {}'.format(url))
+                # event subscriptions are not used, so no websocket is opened on login
+                session = ApicSession(aci.Session(url, username, password, verify_ssl=verify_ssl,
+                                                  subscription_enabled=False),
+                                      url, max_inflight=self.max_inflight)
+                self._sessions[key] = session
+        return session
+
+    def discard(self, url, username, password):
+        """
+        Closes the session for the credentials, once they are no longer used
+        """
+        with self._lock:
+            session = self._sessions.pop(credential_key(url, 0, username, password), None)
+        if session is not None:
+            session.close()
+
+
+# Shared by every APIC object in the process
+apic_sessions = ApicSessionManager()
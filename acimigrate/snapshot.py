@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+from functools import wraps
+import threading
+import time
+import logging
+from acimigrate.metrics import timed_table
+
+logger = logging.getLogger(__name__)
+
+# Seconds a discovered table is considered fresh
+SNAPSHOT_TTL = 300
+
+
+class Snapshot(object):
+    """
+    Caches the result of device show-commands so that a discovery only
+    queries each table once.  Entries expire after ``ttl`` seconds and can
+    be invalidated explicitly, e.g. after a configuration change.
+    """
+
+    def __init__(self, ttl=SNAPSHOT_TTL):
+        self.ttl = ttl
+        self._tables = {}
+        self._lock = threading.RLock()
+
+    def get(self, name, loader):
+        """
+        Returns the cached table, calling loader() to fetch it when it is
+        missing or expired
+        :param name: str table name
+        :param loader: callable returning the table
+        :return: the table
+        """
+        with self._lock:
+            entry = self._tables.get(name)
+            if entry is not None and not self._expired(entry[0]):
+                return entry[1]
+            logger.debug('Snapshot miss for {}'.format(name))
+            value = loader()
+            self._tables[name] = (time.time(), value)
+            return value
+
+    def _expired(self, fetched):
+        if self.ttl is None:
+            return False
+        return time.time() - fetched > self.ttl
+
+    def invalidate(self, *names):
+        """
+        Drops the given tables, or every table when called without names
+        """
+        with self._lock:
+            if not names:
+                self._tables.clear()
+            for name in names:
+                self._tables.pop(name, None)
+
+    def age(self, name):
+        """
+        :param name: str table name
+        :return: seconds since the table was fetched, None if not cached
+        """
+        entry = self._tables.get(name)
+        if entry is None:
+            return None
+        return time.time() - entry[0]
+
+
+def snapshot_property(func):
+    """
+    Property decorator that serves the value from the owner's ``snapshot``
+    """
+    name = func.__name__
+
+    def load(self):
+        with timed_table(name):
+            return func(self)
+
+    @wraps(func)
+    def getter(self):
+        return self.snapshot.get(name, lambda: load(self))
+    return property(getter)
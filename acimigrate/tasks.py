@@ -1,6 +1,8 @@
 import logging
-import ipaddress
-import random
+import time
+from acimigrate.gateways import resolve_gateways
+from acimigrate.portchannels import PortChannelAllocator
+from acimigrate.scheduler import PushScheduler
 
 logger = logging.getLogger(__name__)
 
@@ -10,73 +12,114 @@ logger.info('Loading Tasks')
 def migrate(nx, apic, nx2, auto=True,
             layer3=False, n1_int_list=None,
             n2_int_list=None,
-            aci_interface_dict=None):
+            aci_interface_dict=None,
+            progress=None,
+            journal=None,
+            skip_committed=True):
+    """
+    Migrates the vlans discovered on nx to the ACI fabric
 
-    apic.apic_migration_dict = aci_interface_dict
-    full_migration_dict = nx.migration_dict()
+    :param progress: callable(step, item, status, elapsed) used to report
+                     progress, e.g. Job.progress when run as a background job
+    :param journal: journal.JournalRun recording each step, EPGs and Nexus
+                    port-channels it has as committed are not applied again
+    :param skip_committed: bool leave the EPGs the journal has as committed
+                           out of the push.  Turned off when pushing through a
+                           ReconcilingSession, which skips unchanged objects
+                           itself and must see every EPG to tell which are stale
+    :return: dict of vlan name -> status, plus the chosen nx1pc/nx2pc
+    """
+    if progress is None:
+        progress = lambda step, item=None, status=None, elapsed=None: None
+    if journal is not None:
+        report = progress
+
+        def progress(step, item=None, status=None, elapsed=None):
+            journal.record(step, item, status, elapsed)
+            report(step, item, status, elapsed)
 
-    # TODO - Test not using nx1pc_list,
-    # but use nx.pc_list() directly in below while statement
-    nx1pc_list = nx.pc_list()
-    migration_dict = full_migration_dict['vlans']
-    nx1pc = random.randrange(1, 4096)
-    nx2pc = nx1pc
+    apic.apic_migration_dict = aci_interface_dict
+    model = nx.vlan_model
 
-    # TODO - Test for condition in nx2, and re-run until both nx1pc and nx2pc are valid
-    while not(nx1pc not in nx.vpc_dict["vpc_list"] and nx1pc not in nx1pc_list):
-        nx1pc = random.randrange(1, 4096)
+    nx1pc = journal.get('nx1pc') if journal is not None else None
+    if nx1pc is None:
+        # lowest port-channel number free on both peers, the port-channel
+        # and vpc tables are served from the discovery snapshot
+        nx1pc = PortChannelAllocator.for_devices(nx, nx2).allocate()
+        if journal is not None:
+            # kept before anything is configured so a resumed run reuses it
+            journal.set('nx1pc', nx1pc)
+            journal.set('nx2pc', nx1pc)
+    nx2pc = journal.get('nx2pc', nx1pc) if journal is not None else nx1pc
 
     print "********"
-    print migration_dict
+    print model.records
     print "********"
     result = {}
-    # Create a physical domain and VLAN pool for all the vlans
-    vlan_list = migration_dict.keys()
-    apic.migration_physdom('acimigrate', vlan_list)
 
-    # Create Node Profiles
+    def push_progress(name, status, elapsed):
+        progress(name, None, status, elapsed)
+
+    # Vlan pool, physdom, policies, vpc policy group and interface selectors
+    # are pushed in parallel where their dependencies allow
+    print "Creating physical domain, VPC Policy Group and Interface Selectors for migration interfaces"
+    scheduler = PushScheduler(callback=push_progress)
+    apic.schedule_migration_policies(scheduler, 'acimigrate', model.vids,
+                                     'legacy-nexus-vpc', incremental=True)
+    scheduler.run()
 
+    if auto:
+        vlans = {}
+        gateways = {}
+        if layer3:
+            # every VIP is placed in its subnet once, before anything is built
+            gateways, mismatches = resolve_gateways(model)
+            for mismatch in mismatches:
+                progress('gateway', model[mismatch.vid].name, 'MISMATCH: {}'.format(mismatch))
+            if mismatches:
+                result['gateway_mismatches'] = [str(m) for m in mismatches]
+        for record in model:
+            vlans[record.vid] = {'name': record.name}
+            if record.vid in gateways:
+                vlans[record.vid]['mac_address'] = record.vmac
+                vlans[record.vid]['nets'] = gateways[record.vid]
 
-    print "Creating VPC Policy Group for migration interfaces"
-    print apic.create_vpc_policy_group('legacy-nexus-vpc')
-    print "Creating Interface Selectors for migration interfaces"
-    print apic.create_interface_selector()
+        def epg_progress(v, status, elapsed):
+            progress('epg', model[v].name, status, elapsed)
 
+        status = {}
+        if journal is not None and skip_committed:
+            # EPGs committed by an interrupted run are not pushed again
+            committed = journal.committed('epg')
+            for v in vlans.keys():
+                if vlans[v]['name'] in committed:
+                    status[v] = committed[vlans[v]['name']]
+                    del vlans[v]
 
-    for v in migration_dict.keys():
-        name = migration_dict[v]['name']
-        hsrp = migration_dict[v]['hsrp']
-        if auto:
-            tenant = apic.create_epg_for_vlan(name, v)
-            if tenant.ok:
+        # All EPGs and BDs are committed in a few tenant level batches
+        status.update(apic.create_epgs_for_vlans(vlans, callback=epg_progress))
+        for v in status:
+            name = model[v].name
+            result[name] = status[v]
+            if status[v] == 'SUCCESS':
                 logger.info('Created EPG for vlan {}'.format(name))
                 print 'Created EPG for vlan {}'.format(name)
-                result[name] = 'SUCCESS'
+                if vlans.get(v, {}).get('nets'):
+                    logger.info('Layer 3 migration '
+                                'for {} vlan completed'.format(name))
+                    print 'Layer 3 migration for {}' \
+                          ' vlan completed'.format(name)
             else:
                 logger.info('Failed to create EPG for vlan {}'.format(name))
                 print 'Failed to create EPG for vlan {}'.format(name)
-                result[name] = 'FAILED'
-            if layer3 and hsrp:
-                    count = 0
-                    for vip in hsrp['vips']:
-                        ip = unicode(vip)
-                        subnet = unicode(hsrp['subnets'][count]+"/"+str(hsrp['masks'][count]))
-                        if ipaddress.ip_address(ip) in ipaddress.ip_network(subnet):
-                            mask = str(hsrp['masks'][count])
-                        else:
-                            mask = "24"
-                        tenant = apic.create_epg_for_vlan(name,
-                                                          v,
-                                                          mac_address=hsrp['vmac'],
-                                                          net=vip+'/'+mask)
-                        count = count + 1
-                        if tenant.ok:
-                            logger.info('Layer 3 migration '
-                                        'for {} vlan completed'.format(name))
-                            print 'Layer 3 migration for {}' \
-                                  ' vlan completed'.format(name)
-    nx.config_phy_connection(n1_int_list, str(nx1pc))
+    configured = journal.committed('nexus-vpc') if journal is not None else {}
+    for device, int_list, pc in ((nx, n1_int_list, nx1pc), (nx2, n2_int_list, nx2pc)):
+        if device.host in configured:
+            print 'port-channel{} already configured on {}'.format(pc, device.host)
+            continue
+        start = time.time()
+        device.config_phy_connection(int_list, str(pc))
+        progress('nexus-vpc', device.host, 'port-channel{}'.format(pc), time.time() - start)
     result['nx1pc'] = nx1pc
-    nx2.config_phy_connection(n2_int_list, str(nx2pc))
     result['nx2pc'] = nx2pc
     return result
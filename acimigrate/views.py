@@ -1,9 +1,15 @@
 #!/usr/bin/env python
 from functools import wraps
-from flask import render_template, request, redirect
+import json
+from flask import render_template, request, redirect, jsonify, Response, abort
 from forms import ConfigureForm, MigrationForm
 from acimigrate import app
-from acimigrate.Devices import Nexus, APIC
+from acimigrate.discovery import discover
+from acimigrate.jobs import JobManager
+from acimigrate.journal import Journal
+from acimigrate.metrics import registry
+from acimigrate.reconcile import reconcile
+from acimigrate.sessions import apic_sessions
 from tasks import migrate
 import logging
 
@@ -14,6 +20,8 @@ configured = False
 apic = None
 nexus = None
 nexus2 = None
+jobs = JobManager()
+journal = Journal()
 
 
 @app.route("/setup", methods=('GET', 'POST'))
@@ -57,39 +65,38 @@ def updateconfig():
     args['nexus2_username'] = request.form['nexus2_username']
     args['nexus2_password'] = request.form['nexus2_password']
 
-    # Get credentials from form
-    nexus = Nexus(args['nexus_hostname'],
-                  args['nexus_username'],
-                  args['nexus_password'])
-    nexus2 = Nexus(args['nexus2_hostname'],
-                   args['nexus2_username'],
-                   args['nexus2_password'])
-    apic = APIC(args['apic_url'],
-                args['apic_username'],
-                args['apic_password'])
+    # Connect to and query all three devices at the same time
+    found = discover(args)
+    previous = apic
+    nexus = found['nexus']['device']
+    nexus2 = found['nexus2']['device']
+    apic = found['apic']['device']
+    if previous is not None and \
+            (previous.url, previous.username, previous.password) != (apic.url, apic.username, apic.password):
+        # stop the login thread of the APIC that was configured before
+        apic_sessions.discard(previous.url, previous.username, previous.password)
     configured = True
 
-    # TODO - move below to a function somewhere else
-    aci_switch_dict = {}
-    aci_switches = apic.list_switches()
-    for aci_switch in aci_switches:
-        if aci_switch.role == 'leaf':
-            switch_int_list = apic.get_switch_interfaces(aci_switch.node)
-            int_list = []
-            for int in switch_int_list:
-                int_list.append(int.attributes['id'])
-            aci_switch_dict[aci_switch.name] = int_list
-
-    # print aci_switch_dict
     return render_template('phase2.html',
-                           data=nexus.migration_dict()['vlans'],
+                           data=found['nexus']['migration_dict']['vlans'],
                            form=form,
-                           n1interfaces=nexus.free_interfaces(),
-                           n2interfaces=nexus2.free_interfaces(),
-                           aci_switch_list=aci_switch_dict,
+                           n1interfaces=found['nexus']['free_interfaces'],
+                           n2interfaces=found['nexus2']['free_interfaces'],
+                           aci_switch_list=found['apic']['aci_switch_dict'],
                            )
 
 
+@app.route("/leaves/<name>/interfaces", methods=['GET'])
+@configuration_required
+def leaf_interfaces(name):
+    """
+    Interfaces of a leaf, loaded by the phase2 page when the leaf is selected
+    """
+    if name not in apic.leaf_nodes:
+        abort(404)
+    return jsonify(interfaces=apic.get_leaf_interface_ids(name))
+
+
 @app.route("/migrate", methods=('GET', 'POST'))
 def domigrate():
     global nexus, apic, nexus2
@@ -98,6 +105,7 @@ def domigrate():
         l3 = True
     else:
         l3 = False
+    delete_stale = 'delete_stale' in request.form
     TENANT_NAME = request.form['tenant_name']
     APP_NAME = request.form['app_name']
     # Get Nexus 1 interfaces from form
@@ -122,16 +130,114 @@ def domigrate():
 
     print "aci inteface dict {}".format(aci_interface_dict)
 
-    apic.migration_tenant(TENANT_NAME, APP_NAME)
     apic.aci_interface_dict = aci_interface_dict
-    result = migrate(nexus,
-                     apic,
-                     nexus2,
-                     auto=True,
-                     layer3=l3,
-                     # TODO Nexus Interface lists should be attached to Nx object??
-                     n1_int_list=n1_int_list,
-                     n2_int_list=n2_int_list,
-                     aci_interface_dict=aci_interface_dict
-                     )
-    return render_template('completed.html', data=result)
+    job = jobs.submit('migrate {}/{}'.format(TENANT_NAME, APP_NAME),
+                      run_migration,
+                      nexus,
+                      apic,
+                      nexus2,
+                      TENANT_NAME,
+                      APP_NAME,
+                      delete_stale=delete_stale,
+                      layer3=l3,
+                      # TODO Nexus Interface lists should be attached to Nx object??
+                      n1_int_list=n1_int_list,
+                      n2_int_list=n2_int_list,
+                      aci_interface_dict=aci_interface_dict
+                      )
+    return redirect('/jobs/{}'.format(job.id))
+
+
+def run_migration(nexus, apic, nexus2, tenant_name, app_name, progress=None,
+                  diff=True, delete_stale=False, resume=True, **kwargs):
+    """
+    Background job body for a migration
+
+    :param diff: bool only push the objects missing or different on the APIC
+    :param delete_stale: bool delete EPGs, BDs and bindings no longer migrated
+    :param resume: bool continue an unfinished migration of the same tenant,
+                   app and Nexus pair from its journal
+    """
+    run = journal.begin('{}/{}/{}/{}'.format(tenant_name, app_name, nexus.host, nexus2.host),
+                        params={'tenant': tenant_name, 'app': app_name}, resume=resume)
+    if run.resumed:
+        progress('resume', run.id, '{} steps already recorded'.format(len(run.steps())))
+    session = apic.session
+    try:
+        if diff:
+            reconciling = reconcile(apic, tenant_name)
+        apic.migration_tenant(tenant_name, app_name)
+        progress('tenant', tenant_name, 'SUCCESS')
+        run.record('tenant', tenant_name, 'SUCCESS')
+        result = migrate(nexus,
+                         apic,
+                         nexus2,
+                         auto=True,
+                         progress=progress,
+                         journal=run,
+                         skip_committed=not diff,
+                         **kwargs)
+        if diff:
+            if delete_stale:
+                result['deleted'] = reconciling.delete_stale()
+            progress('reconcile', tenant_name,
+                     '{} pushed, {} up to date'.format(reconciling.pushed, reconciling.skipped))
+    except Exception:
+        run.finish('failed')
+        raise
+    finally:
+        apic.session = session
+    run.finish('completed')
+    return result
+
+
+def get_job(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        abort(404)
+    return job
+
+
+@app.route("/jobs/<job_id>", methods=['GET'])
+def job_status(job_id):
+    job = get_job(job_id)
+    if job.state == 'completed':
+        return render_template('completed.html', data=job.result)
+    return render_template('job.html', job=job)
+
+
+@app.route("/jobs/<job_id>/status", methods=['GET'])
+def job_poll(job_id):
+    """
+    Polling endpoint, returns the job state and the events after ?since=
+    """
+    job = get_job(job_id)
+    return jsonify(job.to_dict(request.args.get('since', 0, type=int)))
+
+
+@app.route("/jobs/<job_id>/events", methods=['GET'])
+def job_events(job_id):
+    """
+    Server-sent event stream of the job progress
+    """
+    job = get_job(job_id)
+
+    def stream():
+        seq = 0
+        while True:
+            done = job.done
+            for event in job.events_since(seq, timeout=15):
+                seq = event['seq'] + 1
+                yield 'event: progress\ndata: {}\n\n'.format(json.dumps(event))
+            if done:
+                yield 'event: {}\ndata: {}\n\n'.format(job.state, json.dumps({'error': job.error}))
+                break
+    return Response(stream(), mimetype='text/event-stream')
+
+
+@app.route("/metrics", methods=['GET'])
+def metrics():
+    """
+    Prometheus scrape endpoint, device RPC latency and payload histograms
+    """
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""
+Helpers for turning VLAN sets into range notation e.g. 10-20,35,40-99
+"""
+
+# Longest vlan list NX-OS accepts in a single switchport trunk command
+NXOS_MAX_VLAN_LIST_LEN = 200
+
+
+def vlan_ranges(vlans):
+    """
+    Merges vlan ids into sorted contiguous ranges
+    :param vlans: iterable of int or str vlan ids
+    :return: list of (first, last) int tuples
+    """
+    ranges = []
+    for vlan in sorted(set(int(v) for v in vlans)):
+        if ranges and vlan == ranges[-1][1] + 1:
+            ranges[-1] = (ranges[-1][0], vlan)
+        else:
+            ranges.append((vlan, vlan))
+    return ranges
+
+
+def range_token(first, last):
+    """
+    :return: str e.g. 10-20, or 35 for a single vlan
+    """
+    if first == last:
+        return str(first)
+    return '{}-{}'.format(first, last)
+
+
+def range_string(vlans):
+    """
+    :param vlans: iterable of vlan ids
+    :return: str e.g. 10-20,35,40-99
+    """
+    return ','.join(range_token(first, last) for first, last in vlan_ranges(vlans))
+
+
+def range_strings(vlans, max_len=NXOS_MAX_VLAN_LIST_LEN):
+    """
+    Splits a vlan set into as few range strings as possible, each no longer
+    than max_len characters
+    :param vlans: iterable of vlan ids
+    :param max_len: int
+    :return: list of str
+    """
+    strings = []
+    current = ''
+    for first, last in vlan_ranges(vlans):
+        token = range_token(first, last)
+        if current and len(current) + 1 + len(token) > max_len:
+            strings.append(current)
+            current = ''
+        current = token if not current else current + ',' + token
+    if current:
+        strings.append(current)
+    return strings
+
+
+def parse_range_string(ranges):
+    """
+    Expands a range string back into vlan ids
+    :param ranges: str e.g. 10-20,35
+    :return: set of int
+    """
+    vlans = set()
+    for token in ranges.split(','):
+        token = token.strip()
+        if not token:
+            continue
+        if '-' in token:
+            first, last = token.split('-', 1)
+            vlans.update(range(int(first), int(last) + 1))
+        else:
+            vlans.add(int(token))
+    return vlans
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""
+Runs every benchmark suite, compares with the last recorded run and
+optionally appends the results to benchmarks/results.jsonl so they can be
+tracked over time.
+
+    python -m benchmarks [--record] [--sizes 100,1000]
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+from benchmarks import bench_migration, bench_nxparse, fixtures
+
+RESULTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results.jsonl')
+
+SUITES = [('nxparse', bench_nxparse), ('migration', bench_migration)]
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=os.path.dirname(__file__)).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def last_run(path=RESULTS_PATH):
+    """
+    :return: dict of (suite, case, rows) -> seconds from the last recorded run
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        lines = [line for line in f if line.strip()]
+    if not lines:
+        return {}
+    run = json.loads(lines[-1])
+    return dict(((r['suite'], r['case'], r['rows']), r['seconds']) for r in run['results'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the acimigrate benchmarks')
+    parser.add_argument('--record', action='store_true', help='append the results to {}'.format(RESULTS_PATH))
+    parser.add_argument('--sizes', type=lambda s: tuple(int(n) for n in s.split(',')),
+                        help='comma separated row counts up to {}, one vlan per row, '
+                             'defaults to each suite\'s own'.format(fixtures.MAX_VLANS))
+    parser.add_argument('--suite', action='append', choices=[name for name, suite in SUITES])
+    args = parser.parse_args(argv)
+
+    previous = last_run()
+    results = []
+    print '{:<12}{:<24}{:>8}{:>12}{:>10}'.format('suite', 'case', 'rows', 'best (s)', 'change')
+    for name, suite in SUITES:
+        if args.suite and name not in args.suite:
+            continue
+        for result in suite.run(args.sizes) if args.sizes else suite.run():
+            result['suite'] = name
+            results.append(result)
+            before = previous.get((name, result['case'], result['rows']))
+            change = '{:+.0%}'.format(result['seconds'] / before - 1) if before else ''
+            print '{:<12}{case:<24}{rows:>8}{seconds:>12.4f}{change:>10}'.format(name, change=change, **result)
+
+    if args.record:
+        run = {'time': time.time(),
+               'revision': git_revision(),
+               'python': platform.python_version(),
+               'results': results}
+        with open(RESULTS_PATH, 'a') as f:
+            f.write(json.dumps(run, sort_keys=True) + '\n')
+
+
+if __name__ == '__main__':
+    main()
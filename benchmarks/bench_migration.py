@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+"""
+Times discovery, migration_dict, APIC payload generation and a full
+tasks.migrate against plan mode devices answering from synthetic fixtures.
+
+    python -m benchmarks.bench_migration
+"""
+from contextlib import contextmanager
+import os
+import sys
+import timeit
+from acimigrate.plan import Plan, plan_migration
+from benchmarks import fixtures
+
+# the largest size is every usable vlan on the switch
+SIZES = (100, 1000, fixtures.MAX_VLANS)
+REPEAT = 3
+LEAVES = 2
+
+
+@contextmanager
+def quiet():
+    """
+    Drops the progress prints of the code under test
+    """
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        yield
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+
+def devices(rows):
+    """
+    :return: (Plan, Nexus, APIC, Nexus vpc peer) answering from fixtures
+    """
+    plan = Plan()
+    replies = fixtures.nexus_replies(rows)
+    fabric = fixtures.ApicFixture(fixtures.fabric_nodes(LEAVES) + fixtures.l1_phys_ifs(LEAVES))
+    nx = plan.nexus('nexus', replies=replies)
+    nx2 = plan.nexus('nexus2', replies=replies)
+    apic = plan.apic('apic', session=fabric)
+    return plan, nx, apic, nx2
+
+
+def bench_discovery(rows):
+    plan, nx, apic, nx2 = devices(rows)
+
+    def run():
+        nx.refresh()
+        for name, node in apic.list_leaves().items():
+            apic.refresh_switch_interfaces(node)
+    return run
+
+
+def bench_migration_dict(rows):
+    plan, nx, apic, nx2 = devices(rows)
+    nx.refresh()
+
+    def run():
+        nx.invalidate('vlan_model')
+        nx.migration_dict()
+    return run
+
+
+def bench_payload(rows):
+    plan, nx, apic, nx2 = devices(rows)
+    model = nx.vlan_model
+    apic.migration_leaves = ['101', '102']
+    apic.migration_vpc_rn = 'legacy-nexus-vpc'
+    apic.physdom = 'acimigrate'
+    vlans = dict((r.vid, {'name': r.name}) for r in model)
+
+    def run():
+        apic.migration_tenant('bench', 'bench', provision=False)
+        apic.create_epgs_for_vlans(vlans)
+    return run
+
+
+def bench_migrate(rows):
+    aci_interface_dict = dict((fixtures.leaf_name(n), [['eth1/1'], ['eth1/2']]) for n in range(LEAVES))
+
+    def run():
+        plan, nx, apic, nx2 = devices(rows)
+        plan_migration(plan, nx, apic, nx2, 'bench', 'bench',
+                       layer3=True,
+                       n1_int_list=['Ethernet1/1', 'Ethernet1/2'],
+                       n2_int_list=['Ethernet1/1', 'Ethernet1/2'],
+                       aci_interface_dict=aci_interface_dict)
+    return run
+
+
+CASES = [('discovery', bench_discovery),
+         ('migration_dict', bench_migration_dict),
+         ('payload', bench_payload),
+         ('tasks.migrate', bench_migrate)]
+
+
+def best(func):
+    with quiet():
+        return min(timeit.repeat(func, number=1, repeat=REPEAT))
+
+
+def run(sizes=SIZES):
+    """
+    :return: list of dicts with case, rows and seconds
+    """
+    results = []
+    for name, case in CASES:
+        for rows in sizes:
+            with quiet():
+                func = case(rows)
+            results.append({'case': name, 'rows': rows, 'seconds': best(func)})
+    return results
+
+
+def main():
+    print '{:<24}{:>8}{:>12}'.format('case', 'rows', 'best (s)')
+    for result in run():
+        print '{case:<24}{rows:>8}{seconds:>12.4f}'.format(**result)
+
+
+if __name__ == '__main__':
+    main()
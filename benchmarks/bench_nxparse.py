@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""
+Compares the NX-OS table parsers against the full document scan they
+replaced, on synthetic replies of increasing size.
+
+    python -m benchmarks.bench_nxparse
+"""
+import timeit
+import xml.etree.ElementTree as ET
+from acimigrate.nxparse import VLAN_TABLE, HSRP_TABLE, INTERFACE_TABLE
+from benchmarks import fixtures
+
+# the largest size is every usable vlan on the switch
+SIZES = (1000, 2000, fixtures.MAX_VLANS)
+REPEAT = 3
+
+
+def legacy_vlans(ncdata):
+    """
+    The root.iter() x findall scan used before acimigrate.nxparse
+    """
+    root = ET.fromstring(ncdata)
+    ns_map = {'vlans': VLAN_TABLE.namespace}
+    vlan_dict = {}
+    for c in root.iter():
+        for v in c.findall('vlans:ROW_vlanbrief', ns_map):
+            vlan_dict[v.find('vlans:vlanshowbr-vlanid-utf', ns_map).text] = \
+                v.find('vlans:vlanshowbr-vlanname', ns_map).text
+    return vlan_dict
+
+
+def legacy_hsrp(ncdata):
+    root = ET.fromstring(ncdata)
+    ns_map = {'groups': HSRP_TABLE.namespace}
+    hsrp_dict = {}
+    for c in root.iter():
+        for i in c.findall('groups:ROW_grp_detail', ns_map):
+            vip_list = [i.find('groups:sh_vip', ns_map).text]
+            secondaries = i.find('groups:TABLE_grp_vip_sec', ns_map)
+            if secondaries is not None:
+                for sec in secondaries.iter():
+                    vip_list.extend(ip.text for ip in sec.findall('groups:sh_vip_sec', ns_map))
+            hsrp_dict[i.find('groups:sh_if_index', ns_map).text] = vip_list
+    return hsrp_dict
+
+
+def legacy_interfaces(ncdata):
+    root = ET.fromstring(ncdata)
+    ns_map = {'groups': INTERFACE_TABLE.namespace}
+    int_list = []
+    for c in root.iter():
+        for i in c.findall('groups:ROW_interface', ns_map):
+            int_list.append(i.find('groups:interface', ns_map).text)
+    return int_list
+
+
+CASES = [
+    ('show vlan', fixtures.show_vlan, legacy_vlans,
+     lambda data: dict((v.vlanid, v.name) for v in VLAN_TABLE.rows(data))),
+    ('show hsrp detail', fixtures.show_hsrp_detail, legacy_hsrp,
+     lambda data: dict((i.intf, [i.vip] + [s.vip for s in i.secondaries])
+                       for i in HSRP_TABLE.rows(data))),
+    ('show interface status', fixtures.show_interface_status, legacy_interfaces,
+     lambda data: [i.interface for i in INTERFACE_TABLE.rows(data)]),
+]
+
+
+def best(func, data):
+    return min(timeit.repeat(lambda: func(data), number=1, repeat=REPEAT))
+
+
+def run(sizes=SIZES):
+    """
+    :return: list of dicts with case, rows, seconds and the legacy scan time
+    """
+    results = []
+    for name, fixture, legacy, table in CASES:
+        for rows in sizes:
+            data = fixture(rows)
+            assert legacy(data) == table(data)
+            results.append({'case': name, 'rows': rows,
+                            'seconds': best(table, data), 'legacy': best(legacy, data)})
+    return results
+
+
+def main():
+    print '{:<24}{:>8}{:>12}{:>12}{:>9}'.format('table', 'rows', 'scan (s)', 'table (s)', 'speedup')
+    for result in run():
+        print '{:<24}{:>8}{:>12.4f}{:>12.4f}{:>8.1f}x'.format(result['case'], result['rows'], result['legacy'],
+                                                         result['seconds'], result['legacy'] / result['seconds'])
+
+
+if __name__ == '__main__':
+    main()
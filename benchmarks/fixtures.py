@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+"""
+Synthetic NX-OS NETCONF replies and APIC query responses used by the
+benchmarks
+"""
+import re
+import urlparse
+from acimigrate.plan import PlanResponse
+
+REPLY = ('<?xml version="1.0" encoding="ISO-8859-1"?>\n'
+         '<rpc-reply xmlns="urn:ietf:params:xml:ns:netconf:base:1.0" '
+         'xmlns:if="http://www.cisco.com/nxos:1.0:if_manager" message-id="1">'
+         '<data><show xmlns="{ns}"><__XML__OPT_Cmd_show_{cmd}>'
+         '<__readonly__>{body}</__readonly__>'
+         '</__XML__OPT_Cmd_show_{cmd}></show></data></rpc-reply>')
+
+
+def reply(ns, cmd, body):
+    return REPLY.format(ns=ns, cmd=cmd, body=body)
+
+
+# Usable NX-OS vlans, 2-3967, 1 and 3968-4094 are reserved
+MAX_VLANS = 3966
+
+
+def vlan_id(n):
+    """
+    Maps a row number onto the usable vlan range, every row gets its own
+    vlan as on a real switch
+    """
+    if not 0 <= n < MAX_VLANS:
+        raise ValueError('row {} is past the {} usable vlans'.format(n, MAX_VLANS))
+    return 2 + n
+
+
+def show_vlan(rows):
+    body = ''.join('<ROW_vlanbrief>'
+                   '<vlanshowbr-vlanid>{0}</vlanshowbr-vlanid>'
+                   '<vlanshowbr-vlanid-utf>{0}</vlanshowbr-vlanid-utf>'
+                   '<vlanshowbr-vlanname>VLAN{0:04d}</vlanshowbr-vlanname>'
+                   '<vlanshowbr-vlanstate>active</vlanshowbr-vlanstate>'
+                   '<vlanshowbr-shutstate>noshutdown</vlanshowbr-shutstate>'
+                   '</ROW_vlanbrief>'.format(vlan_id(n)) for n in range(rows))
+    return reply('http://www.cisco.com/nxos:1.0:vlan_mgr_cli', 'vlan',
+                 '<TABLE_vlanbrief>{}</TABLE_vlanbrief>'.format(body))
+
+
+def _address(n, octet):
+    v = vlan_id(n)
+    return '10.{}.{}.{}'.format(v // 256, v % 256, octet)
+
+
+def show_hsrp_detail(rows):
+    body = ''.join('<ROW_grp_detail>'
+                   '<sh_if_index>Vlan{0}</sh_if_index>'
+                   '<sh_group_num>1</sh_group_num>'
+                   '<sh_group_state>Active</sh_group_state>'
+                   '<sh_vip>{1}</sh_vip>'
+                   '<sh_vmac>0000.0c9f.f{2:03x}</sh_vmac>'
+                   '<TABLE_grp_vip_sec><ROW_grp_vip_sec>'
+                   '<sh_vip_sec>172.{3}.{4}.1</sh_vip_sec>'
+                   '</ROW_grp_vip_sec></TABLE_grp_vip_sec>'
+                   '</ROW_grp_detail>'.format(vlan_id(n), _address(n, 1), vlan_id(n) % 4096,
+                                              16 + vlan_id(n) // 256, vlan_id(n) % 256)
+                   for n in range(rows))
+    return reply('http://www.cisco.com/nxos:1.0:hsrp_engine', 'hsrp',
+                 '<TABLE_grp_detail>{}</TABLE_grp_detail>'.format(body))
+
+
+def show_ip_interface(rows):
+    body = ''.join('<ROW_intf>'
+                   '<intf-name>Vlan{0}</intf-name>'
+                   '<proto-state>up</proto-state>'
+                   '<prefix>{1}</prefix>'
+                   '<subnet>{2}</subnet>'
+                   '<masklen>24</masklen>'
+                   '<TABLE_secondary_address><ROW_secondary_address>'
+                   '<prefix1>172.{3}.{4}.2</prefix1>'
+                   '<subnet1>172.{3}.{4}.0</subnet1>'
+                   '<masklen1>24</masklen1>'
+                   '</ROW_secondary_address></TABLE_secondary_address>'
+                   '</ROW_intf>'.format(vlan_id(n), _address(n, 2), _address(n, 0),
+                                        16 + vlan_id(n) // 256, vlan_id(n) % 256)
+                   for n in range(rows))
+    return reply('http://www.cisco.com/nxos:1.0:ip', 'ip_interface',
+                 '<TABLE_intf>{}</TABLE_intf>'.format(body))
+
+
+def interface_name(n):
+    return 'Ethernet{}/{}'.format(1 + n // 48, 1 + n % 48)
+
+
+def show_port_channel_summary(rows, members=2):
+    body = ''.join('<ROW_channel>'
+                   '<group>{0}</group>'
+                   '<port-channel>port-channel{0}</port-channel>'
+                   '<layer>S</layer><status>U</status><type>Eth</type><prtcl>LACP</prtcl>'
+                   '<TABLE_member>{1}</TABLE_member>'
+                   '</ROW_channel>'.format(1 + n,
+                                           ''.join('<ROW_member><port>{}</port>'
+                                                   '<port-status>P</port-status></ROW_member>'
+                                                   .format(interface_name(n * members + m))
+                                                   for m in range(members)))
+                   for n in range(rows))
+    return reply('http://www.cisco.com/nxos:1.0:eth_pcm_dc3', 'port_channel_summary',
+                 '<TABLE_channel>{}</TABLE_channel>'.format(body))
+
+
+def show_vpc(rows):
+    body = ''.join('<ROW_vpc>'
+                   '<vpc-id>{0}</vpc-id>'
+                   '<vpc-ifindex>port-channel{0}</vpc-ifindex>'
+                   '<vpc-port-state>1</vpc-port-state>'
+                   '</ROW_vpc>'.format(1 + n) for n in range(rows))
+    return reply('http://www.cisco.com/nxos:1.0:mcecm', 'vpc',
+                 '<TABLE_vpc>{}</TABLE_vpc>'.format(body))
+
+
+def show_interface_status(rows):
+    body = ''.join('<ROW_interface>'
+                   '<interface>{}</interface>'
+                   '<state>connected</state><vlan>trunk</vlan>'
+                   '<duplex>full</duplex><speed>10G</speed><type>10Gbase-SR</type>'
+                   '</ROW_interface>'.format(interface_name(n)) for n in range(rows))
+    return reply('http://www.cisco.com/nxos:1.0:if_manager', 'interface',
+                 '<TABLE_interface>{}</TABLE_interface>'.format(body))
+
+
+def nexus_replies(rows):
+    """
+    Replies for every show command a migration reads, keyed by command as
+    acimigrate.plan.query_command names them
+    """
+    channels = max(1, rows // 10)
+    return {'vlan': show_vlan(rows),
+            'hsrp detail': show_hsrp_detail(rows),
+            'ip interface': show_ip_interface(rows),
+            'port-channel summary': show_port_channel_summary(channels),
+            'vpc': show_vpc(channels),
+            'interface status': show_interface_status(rows)}
+
+
+def leaf_name(n):
+    return 'leaf-{}'.format(101 + n)
+
+
+def fabric_nodes(leaves, spines=2):
+    """
+    fabricNode MOs for a pod of leaves and spines
+    """
+    nodes = []
+    for n in range(leaves):
+        nodes.append(('leaf', 101 + n, leaf_name(n)))
+    for n in range(spines):
+        nodes.append(('spine', 201 + n, 'spine-{}'.format(201 + n)))
+    return [{'fabricNode': {'attributes': {'dn': 'topology/pod-1/node-{}'.format(node),
+                                           'id': str(node),
+                                           'name': name,
+                                           'role': role,
+                                           'fabricSt': 'active'}}}
+            for role, node, name in nodes]
+
+
+def l1_phys_ifs(leaves, ports=48):
+    """
+    l1PhysIf MOs for every port of every leaf
+    """
+    return [{'l1PhysIf': {'attributes': {'dn': 'topology/pod-1/node-{}/sys/phys-[eth1/{}]'.format(101 + n, p),
+                                         'id': 'eth1/{}'.format(p)}}}
+            for n in range(leaves) for p in range(1, ports + 1)]
+
+
+FILTER_RE = re.compile(r'(eq|wcard)\((\w+)\.(\w+),"([^"]*)"\)')
+
+
+def filter_mos(mos, query_filter):
+    """
+    Applies the eq and wcard terms of an APIC query-target-filter, all of
+    which must match
+    """
+    for op, mo_cls, attr, value in FILTER_RE.findall(query_filter or ''):
+        if op == 'eq':
+            mos = [mo for mo in mos if mo.get(mo_cls, {}).get('attributes', {}).get(attr) == value]
+        else:
+            mos = [mo for mo in mos if value in mo.get(mo_cls, {}).get('attributes', {}).get(attr, '')]
+    return mos
+
+
+class ApicFixture(object):
+    """
+    Answers APIC class queries from fixture MOs, honouring the eq/wcard
+    filters and paging the helpers in acimigrate.query send
+    """
+
+    def __init__(self, mos):
+        self.classes = {}
+        for mo in mos:
+            self.classes.setdefault(mo.keys()[0], []).append(mo)
+        self.queries = 0
+
+    def get(self, url):
+        self.queries += 1
+        parsed = urlparse.urlparse(url)
+        params = dict(urlparse.parse_qsl(parsed.query))
+        cls = parsed.path.rsplit('/', 1)[1].split('.')[0]
+        mos = filter_mos(self.classes.get(cls, []), params.get('query-target-filter'))
+        page_size = int(params.get('page-size', len(mos) or 1))
+        page = int(params.get('page', 0))
+        imdata = mos[page * page_size:(page + 1) * page_size]
+        return PlanResponse({'totalCount': str(len(mos)), 'imdata': imdata})
@@ -0,0 +1,374 @@
+#!/usr/bin/env python
+"""
+Stand-in APIC REST server.  Supports aaaLogin/aaaRefresh, POSTs to
+/api/mo/..., class queries and dn queries with query-target, and can add
+latency, a per-object commit cost and throttling.  Posted objects must
+carry a dn or rn unless their class is in APIC_RN, otherwise the whole
+POST is rejected with a 400 as the APIC would.
+
+    python -m simulators.apic --port 8000 --leaves 4 --latency 0.02 --rate-limit 40
+"""
+import argparse
+import BaseHTTPServer
+import Cookie
+import json
+import re
+import SocketServer
+import threading
+import time
+import urlparse
+import uuid
+import logging
+from benchmarks import fixtures
+
+logger = logging.getLogger(__name__)
+
+# Seconds a login token stays valid
+APIC_TOKEN_LIFETIME = 600
+APIC_COOKIE = 'APIC-cookie'
+
+# Relative names of the classes the simulator accepts without an explicit
+# dn, from the APIC management information model.  Kept apart from
+# acimigrate.reconcile so the stored dns do not depend on the code under test.
+APIC_RN = {
+    # tenant
+    'fvTenant': 'tn-{name}', 'fvAp': 'ap-{name}', 'fvAEPg': 'epg-{name}',
+    'fvBD': 'BD-{name}', 'fvCtx': 'ctx-{name}', 'fvSubnet': 'subnet-[{ip}]',
+    'fvRsBd': 'rsbd', 'fvRsCtx': 'rsctx', 'fvRsDomAtt': 'rsdomAtt-[{tDn}]',
+    'fvRsPathAtt': 'rspathAtt-[{tDn}]', 'fvRsProv': 'rsprov-{tnVzBrCPName}',
+    'fvRsCons': 'rscons-{tnVzBrCPName}',
+    # contracts
+    'vzBrCP': 'brc-{name}', 'vzSubj': 'subj-{name}', 'vzFilter': 'flt-{name}',
+    'vzEntry': 'e-{name}', 'vzRsSubjFiltAtt': 'rssubjFiltAtt-{tnVzFilterName}',
+    # access policies
+    'fvnsVlanInstP': 'vlanns-[{name}]-{allocMode}', 'fvnsEncapBlk': 'from-[{from}]-to-[{to}]',
+    'physDomP': 'phys-{name}', 'infraRsVlanNs': 'rsvlanNs',
+    'infraAttEntityP': 'attentp-{name}', 'infraRsDomP': 'rsdomP-[{tDn}]',
+    'cdpIfPol': 'cdpIfP-{name}', 'lacpLagPol': 'lacplagp-{name}', 'fabricHIfPol': 'hintfpol-{name}',
+    'infraAccBndlGrp': 'accbundle-{name}', 'infraRsAttEntP': 'rsattEntP',
+    'infraRsCdpIfPol': 'rscdpIfPol', 'infraRsHIfPol': 'rshIfPol', 'infraRsLacpPol': 'rslacpPol',
+    'infraAccPortP': 'accportprof-{name}', 'infraHPortS': 'hports-{name}-typ-{type}',
+    'infraPortBlk': 'portblk-{name}', 'infraRsAccBaseGrp': 'rsaccBaseGrp',
+    'infraNodeP': 'nprof-{name}', 'infraRsAccPortP': 'rsaccPortP-[{tDn}]',
+    'infraLeafS': 'leaves-{name}-typ-{type}', 'infraNodeBlk': 'nodeblk-{name}',
+}
+
+# The dn a REST url addresses, e.g. /api/mo/uni/infra.json -> uni/infra
+URL_DN_RE = re.compile(r'^/api/(?:node/)?mo/(.*?)(?:\.json|\.xml)?$')
+
+
+def error(status, text):
+    return status, {'totalCount': '1',
+                    'imdata': [{'error': {'attributes': {'code': str(status), 'text': text}}}]}
+
+
+def imdata(mos):
+    return 200, {'totalCount': str(len(mos)), 'imdata': mos}
+
+
+def url_dn(path):
+    match = URL_DN_RE.match(path)
+    return match.group(1) if match else ''
+
+
+class InvalidObject(Exception):
+    """
+    Raised for a posted object the APIC would reject
+    """
+
+
+def object_dn(cls, attrs, parent_dn):
+    """
+    :return: str dn of a posted object, from its dn, rn or naming properties
+    """
+    if attrs.get('dn'):
+        return attrs['dn']
+    if attrs.get('rn'):
+        return '{}/{}'.format(parent_dn, attrs['rn'])
+    if cls not in APIC_RN:
+        raise InvalidObject('Unknown class {} without a dn under {}'.format(cls, parent_dn))
+    try:
+        return '{}/{}'.format(parent_dn, APIC_RN[cls].format(**attrs))
+    except KeyError as e:
+        raise InvalidObject('{} under {} is missing naming property {}'.format(cls, parent_dn, e))
+
+
+def flatten(obj, parent_dn):
+    """
+    :return: list of (dn, class, attributes) for an object and its children
+    """
+    cls = obj.keys()[0]
+    attrs = dict(obj[cls].get('attributes', {}))
+    dn = object_dn(cls, attrs, parent_dn)
+    objects = [(dn, cls, attrs)]
+    for child in obj[cls].get('children', []):
+        objects.extend(flatten(child, dn))
+    return objects
+
+
+class ApicSimulator(object):
+    """
+    The object store and behaviour behind the HTTP server
+
+    Throttling: rate_limit answers 429 once more than that many requests
+    arrive within a second, max_concurrent answers 503 when that many
+    requests are already being served.
+    """
+
+    def __init__(self, mos=(), latency=0.0, commit_latency=0.0, rate_limit=None,
+                 max_concurrent=None, token_lifetime=APIC_TOKEN_LIFETIME):
+        """
+        :param mos: MO dicts to seed the store with e.g. fabricNode
+        :param latency: float seconds added to every request
+        :param commit_latency: float seconds added per object in a POST
+        :param rate_limit: int requests per second before answering 429
+        :param max_concurrent: int requests in flight before answering 503
+        :param token_lifetime: int seconds before a token expires
+        """
+        self.latency = latency
+        self.commit_latency = commit_latency
+        self.rate_limit = rate_limit
+        self.max_concurrent = max_concurrent
+        self.token_lifetime = token_lifetime
+        # dn -> (class, attributes)
+        self.objects = {}
+        self.tokens = {}
+        self.posts = []
+        self.requests = 0
+        self.throttled = 0
+        self.inflight = 0
+        self._window = (0, 0)
+        self._lock = threading.RLock()
+        for mo in mos:
+            cls = mo.keys()[0]
+            attrs = dict(mo[cls]['attributes'])
+            self.objects[attrs['dn']] = (cls, attrs)
+
+    # request accounting
+
+    def admit(self):
+        """
+        :return: (status, body) when the request is throttled, else None
+        """
+        with self._lock:
+            self.requests += 1
+            second = int(time.time())
+            start, count = self._window
+            if start != second:
+                start, count = second, 0
+            self._window = (start, count + 1)
+            if self.rate_limit and count + 1 > self.rate_limit:
+                self.throttled += 1
+                return error(429, 'Request throttled, too many requests')
+            if self.max_concurrent and self.inflight >= self.max_concurrent:
+                self.throttled += 1
+                return error(503, 'Service Unavailable, server busy')
+            self.inflight += 1
+        return None
+
+    def release(self):
+        with self._lock:
+            self.inflight -= 1
+
+    # authentication
+
+    def login(self, body):
+        token = uuid.uuid4().hex
+        with self._lock:
+            self.tokens[token] = time.time() + self.token_lifetime
+        user = body.get('aaaUser', {}).get('attributes', {}).get('name', 'admin')
+        return token, imdata([{'aaaLogin': {'attributes': {'token': token,
+                                                           'userName': user,
+                                                           'refreshTimeoutSeconds': str(self.token_lifetime)}}}])
+
+    def valid(self, token):
+        with self._lock:
+            expires = self.tokens.get(token)
+        return expires is not None and expires > time.time()
+
+    # object store
+
+    def _store(self, dn, cls, attrs):
+        if 'deleted' in attrs.get('status', ''):
+            for existing in [d for d in self.objects if d == dn or d.startswith(dn + '/')]:
+                del self.objects[existing]
+            return
+        attrs.pop('status', None)
+        current = self.objects.get(dn, (cls, {}))[1]
+        current.update((k, str(v)) for k, v in attrs.items())
+        current['dn'] = dn
+        self.objects[dn] = (cls, current)
+
+    def post(self, path, body):
+        """
+        Stores every object in the body, or none of them when any is invalid
+        """
+        try:
+            objects = flatten(body, url_dn(path))
+        except InvalidObject as e:
+            return error(400, str(e))
+        deleted = set(dn for dn, cls, attrs in objects if 'deleted' in attrs.get('status', ''))
+        with self._lock:
+            for dn, cls, attrs in objects:
+                # children of a deleted object are deleted with it
+                if dn not in deleted and any(dn.startswith(d + '/') for d in deleted):
+                    continue
+                self._store(dn, cls, attrs)
+            count = len(objects)
+            self.posts.append((path, count))
+        if self.commit_latency:
+            time.sleep(self.commit_latency * count)
+        return imdata([])
+
+    def _mo(self, dn):
+        cls, attrs = self.objects[dn]
+        return {cls: {'attributes': dict(attrs)}}
+
+    def _page(self, mos, params):
+        mos = fixtures.filter_mos(mos, params.get('query-target-filter'))
+        if 'page-size' in params:
+            size = int(params['page-size'])
+            page = int(params.get('page', 0))
+            mos = mos[page * size:(page + 1) * size]
+        return imdata(mos)
+
+    def class_query(self, cls, params):
+        with self._lock:
+            mos = [self._mo(dn) for dn in sorted(self.objects) if self.objects[dn][0] == cls]
+        return self._page(mos, params)
+
+    def dn_query(self, dn, params):
+        target = params.get('query-target', 'self')
+        classes = params.get('target-subtree-class')
+        classes = set(classes.split(',')) if classes else None
+        with self._lock:
+            if target == 'self':
+                dns = [dn] if dn in self.objects else []
+            else:
+                prefix = dn + '/'
+                dns = [d for d in sorted(self.objects) if d.startswith(prefix)]
+                if target == 'children':
+                    dns = [d for d in dns if d.rsplit('/', 1)[0] == dn]
+                elif dn in self.objects:
+                    dns.insert(0, dn)
+            if classes is not None:
+                dns = [d for d in dns if self.objects[d][0] in classes]
+            mos = [self._mo(d) for d in dns]
+        return self._page(mos, params)
+
+
+class ApicHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    # keep-alive, as the APIC sessions pool their connections
+    protocol_version = 'HTTP/1.1'
+    simulator = None
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def _reply(self, status, body, cookie=None):
+        data = json.dumps(body)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        if cookie:
+            self.send_header('Set-Cookie', '{}={}; path=/'.format(APIC_COOKIE, cookie))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _token(self):
+        cookies = Cookie.SimpleCookie(self.headers.get('Cookie', ''))
+        if APIC_COOKIE in cookies:
+            return cookies[APIC_COOKIE].value
+        return None
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length', 0))
+        data = self.rfile.read(length) if length else ''
+        return json.loads(data) if data else {}
+
+    def _handle(self, method):
+        simulator = self.simulator
+        url = urlparse.urlparse(self.path)
+        params = dict(urlparse.parse_qsl(url.query))
+        body = self._body() if method == 'POST' else None
+        throttled = simulator.admit()
+        if throttled:
+            return self._reply(*throttled)
+        try:
+            if simulator.latency:
+                time.sleep(simulator.latency)
+            if url.path in ('/api/aaaLogin.json', '/api/aaaRefresh.json'):
+                if url.path == '/api/aaaRefresh.json' and not simulator.valid(self._token()):
+                    return self._reply(*error(403, 'Token was invalid (Error: Token timeout)'))
+                token, (status, reply) = simulator.login(body or {})
+                return self._reply(status, reply, cookie=token)
+            if not simulator.valid(self._token()):
+                return self._reply(*error(403, 'Token was invalid (Error: Token timeout)'))
+            if method == 'POST' and url.path.startswith('/api/mo/'):
+                return self._reply(*simulator.post(url.path, body))
+            if method == 'GET' and url.path.startswith('/api/node/class/'):
+                cls = url.path.rsplit('/', 1)[1].split('.')[0]
+                return self._reply(*simulator.class_query(cls, params))
+            if method == 'GET' and (url.path.startswith('/api/node/mo/') or url.path.startswith('/api/mo/')):
+                return self._reply(*simulator.dn_query(url_dn(url.path), params))
+            return self._reply(*error(400, 'Unsupported request {} {}'.format(method, url.path)))
+        finally:
+            simulator.release()
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+
+class ThreadingHTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def serve(simulator, host='127.0.0.1', port=8000):
+    """
+    Starts the HTTP server on a background thread
+    :return: ThreadingHTTPServer, shut it down with server.shutdown()
+    """
+    class Handler(ApicHandler):
+        pass
+    Handler.simulator = simulator
+    server = ThreadingHTTPServer((host, port), Handler)
+    thread = threading.Thread(target=server.serve_forever, name='apic-simulator')
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Simulated APIC REST server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--leaves', type=int, default=4)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every request')
+    parser.add_argument('--commit-latency', type=float, default=0.0, help='seconds added per object posted')
+    parser.add_argument('--rate-limit', type=int, help='requests per second before answering 429')
+    parser.add_argument('--max-concurrent', type=int, help='requests in flight before answering 503')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    simulator = ApicSimulator(fixtures.fabric_nodes(args.leaves) + fixtures.l1_phys_ifs(args.leaves),
+                              latency=args.latency,
+                              commit_latency=args.commit_latency,
+                              rate_limit=args.rate_limit,
+                              max_concurrent=args.max_concurrent)
+    server = serve(simulator, args.host, args.port)
+    print 'APIC simulator listening on http://{}:{}'.format(args.host, server.server_address[1])
+    try:
+        while True:
+            time.sleep(60)
+            print '{} requests, {} throttled, {} objects'.format(simulator.requests, simulator.throttled,
+                                                                 len(simulator.objects))
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
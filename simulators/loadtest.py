@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"""
+Runs a full migration against a simulated APIC and Nexus vpc pair over
+real HTTP and NETCONF-over-SSH, and reports throughput.
+
+    python -m simulators.loadtest --rows 2000 --apic-latency 0.02 --netconf-latency 0.05
+"""
+import argparse
+import os
+import sys
+import time
+from acimigrate.Devices import APIC, Nexus
+from acimigrate.sessions import NetconfPool
+from acimigrate.tasks import migrate
+from benchmarks import fixtures
+from simulators import apic as apic_simulator
+from simulators import netconf as netconf_simulator
+
+USERNAME = 'admin'
+PASSWORD = 'simulated'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Migrate against simulated devices')
+    parser.add_argument('--rows', type=int, default=1000, help='vlans on the Nexus pair')
+    parser.add_argument('--leaves', type=int, default=2)
+    parser.add_argument('--apic-latency', type=float, default=0.02)
+    parser.add_argument('--commit-latency', type=float, default=0.0001)
+    parser.add_argument('--netconf-latency', type=float, default=0.05)
+    parser.add_argument('--rate-limit', type=int)
+    parser.add_argument('--max-concurrent', type=int)
+    parser.add_argument('--layer3', action='store_true')
+    args = parser.parse_args(argv)
+
+    fabric = apic_simulator.ApicSimulator(fixtures.fabric_nodes(args.leaves) + fixtures.l1_phys_ifs(args.leaves),
+                                          latency=args.apic_latency,
+                                          commit_latency=args.commit_latency,
+                                          rate_limit=args.rate_limit,
+                                          max_concurrent=args.max_concurrent)
+    server = apic_simulator.serve(fabric, port=0)
+    replies = fixtures.nexus_replies(args.rows)
+    pool = NetconfPool()
+    # (simulator, listening socket) per vpc peer
+    switches = []
+    nexuses = []
+    for n in range(2):
+        switch = netconf_simulator.NexusSimulator(replies, latency=args.netconf_latency,
+                                                  username=USERNAME, password=PASSWORD)
+        listener, listen_port = netconf_simulator.serve(switch, port=0)
+        switches.append((switch, listener))
+        nexuses.append(Nexus('127.0.0.1', USERNAME, PASSWORD, pool=pool, port=listen_port))
+    nx, nx2 = nexuses
+
+    url = 'http://127.0.0.1:{}'.format(server.server_address[1])
+    apic = APIC(url, USERNAME, PASSWORD)
+    aci_interface_dict = dict((fixtures.leaf_name(n), [['eth1/1'], ['eth1/2']]) for n in range(2))
+
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    start = time.time()
+    try:
+        apic.migration_tenant('loadtest', 'loadtest')
+        result = migrate(nx, apic, nx2,
+                         layer3=args.layer3,
+                         n1_int_list=['Ethernet1/1', 'Ethernet1/2'],
+                         n2_int_list=['Ethernet1/1', 'Ethernet1/2'],
+                         aci_interface_dict=aci_interface_dict)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    elapsed = time.time() - start
+    pool.close()
+    server.shutdown()
+
+    migrated = len([v for v in result.values() if v == 'SUCCESS'])
+    print 'migrated {} of {} vlans in {:.2f}s ({:.1f} vlans/s)'.format(migrated, args.rows, elapsed,
+                                                                       migrated / elapsed)
+    print 'APIC: {} requests, {} throttled, {} POSTs, {} objects stored'.format(
+        fabric.requests, fabric.throttled, len(fabric.posts), len(fabric.objects))
+    for n, (switch, listener) in enumerate(switches):
+        print 'nexus{}: {} RPCs, {} edit_configs'.format(n + 1, switch.rpcs, len(switch.edits))
+        listener.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+"""
+Stand-in NX-OS NETCONF-over-SSH server.  Show-command subtree filters are
+answered from canned replies, edit_config payloads are recorded and every
+RPC can be delayed to mimic a real round trip.
+
+    python -m simulators.netconf --port 8830 --rows 1000 --latency 0.05
+"""
+import argparse
+import re
+import socket
+import threading
+import time
+import logging
+import xml.etree.ElementTree as ET
+import paramiko
+from benchmarks import fixtures
+
+logger = logging.getLogger(__name__)
+
+NETCONF_NS = 'urn:ietf:params:xml:ns:netconf:base:1.0'
+# NETCONF 1.0 end of message marker, 1.1 chunked framing is not offered
+EOM = ']]>]]>'
+# Concurrent NETCONF sessions NX-OS allows
+NXOS_MAX_SESSIONS = 8
+
+HELLO = ('<?xml version="1.0" encoding="UTF-8"?>'
+         '<hello xmlns="{ns}"><capabilities>'
+         '<capability>urn:ietf:params:netconf:base:1.0</capability>'
+         '<capability>urn:ietf:params:netconf:capability:writable-running:1.0</capability>'
+         '</capabilities><session-id>{session}</session-id></hello>')
+OK = ('<?xml version="1.0" encoding="UTF-8"?>'
+      '<rpc-reply xmlns="{ns}" message-id="{id}"><ok/></rpc-reply>')
+EMPTY = ('<?xml version="1.0" encoding="UTF-8"?>'
+         '<rpc-reply xmlns="{ns}" message-id="{id}"><data/></rpc-reply>')
+ERROR = ('<?xml version="1.0" encoding="UTF-8"?>'
+         '<rpc-reply xmlns="{ns}" message-id="{id}"><rpc-error>'
+         '<error-type>protocol</error-type><error-tag>operation-not-supported</error-tag>'
+         '<error-severity>error</error-severity><error-message>{message}</error-message>'
+         '</rpc-error></rpc-reply>')
+
+MESSAGE_ID_RE = re.compile(r'message-id="[^"]*"')
+
+
+def localname(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def filter_command(element):
+    """
+    Names the show command of a subtree filter, the same way
+    acimigrate.plan.query_command does for the query string
+    :param element: filter Element
+    :return: str e.g. port-channel summary
+    """
+    names = []
+    children = list(element)
+    while children:
+        element = children[0]
+        names.append(localname(element.tag))
+        children = list(element)
+    return ' '.join(n for n in names if n != 'show')
+
+
+class NexusSimulator(object):
+    """
+    The device behind the SSH server, shared by every session
+    """
+
+    def __init__(self, replies, latency=0.0, username=None, password=None,
+                 max_sessions=NXOS_MAX_SESSIONS):
+        """
+        :param replies: dict of show command -> rpc-reply xml
+        :param latency: float seconds added to every RPC
+        :param username: str accepted user, any when None
+        :param password: str accepted password, any when None
+        :param max_sessions: int concurrent sessions before logins are refused
+        """
+        self.replies = replies
+        self.latency = latency
+        self.username = username
+        self.password = password
+        self.sessions = threading.BoundedSemaphore(max_sessions)
+        self.edits = []
+        self.rpcs = 0
+        self._session_ids = 0
+        self._lock = threading.Lock()
+
+    def accepts(self, username, password):
+        return ((self.username is None or username == self.username) and
+                (self.password is None or password == self.password))
+
+    def session_id(self):
+        with self._lock:
+            self._session_ids += 1
+            return self._session_ids
+
+    def handle(self, message):
+        """
+        Answers one rpc
+        :param message: str rpc xml
+        :return: (str reply xml, bool session closed)
+        """
+        with self._lock:
+            self.rpcs += 1
+        if self.latency:
+            time.sleep(self.latency)
+        rpc = ET.fromstring(message)
+        message_id = rpc.get('message-id', '')
+        operation = list(rpc)[0]
+        name = localname(operation.tag)
+        if name == 'get':
+            selection = operation.find('{%s}filter' % NETCONF_NS)
+            command = filter_command(selection) if selection is not None else ''
+            reply = self.replies.get(command)
+            if reply is None:
+                logger.info('No reply for "{}"'.format(command))
+                return EMPTY.format(ns=NETCONF_NS, id=message_id), False
+            return MESSAGE_ID_RE.sub('message-id="{}"'.format(message_id), reply, count=1), False
+        if name == 'edit-config':
+            config = operation.find('{%s}config' % NETCONF_NS)
+            with self._lock:
+                self.edits.append(ET.tostring(config) if config is not None else '')
+            return OK.format(ns=NETCONF_NS, id=message_id), False
+        if name == 'close-session':
+            return OK.format(ns=NETCONF_NS, id=message_id), True
+        return ERROR.format(ns=NETCONF_NS, id=message_id, message='{} is not simulated'.format(name)), False
+
+
+class _Server(paramiko.ServerInterface):
+
+    def __init__(self, simulator):
+        self.simulator = simulator
+        self.subsystem = threading.Event()
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_auth_password(self, username, password):
+        if self.simulator.accepts(username, password):
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_subsystem_request(self, channel, name):
+        if name != 'netconf':
+            return False
+        self.subsystem.set()
+        return True
+
+
+def _messages(channel):
+    """
+    Yields the EOM framed messages read from a channel
+    """
+    buf = ''
+    while True:
+        data = channel.recv(65536)
+        if not data:
+            return
+        buf += data
+        while EOM in buf:
+            message, buf = buf.split(EOM, 1)
+            yield message.strip()
+
+
+def _session(simulator, channel):
+    channel.sendall(HELLO.format(ns=NETCONF_NS, session=simulator.session_id()) + EOM)
+    messages = _messages(channel)
+    # the client hello
+    next(messages, None)
+    for message in messages:
+        if not message:
+            continue
+        reply, closed = simulator.handle(message)
+        channel.sendall(reply + EOM)
+        if closed:
+            return
+
+
+def _connection(simulator, sock, host_key):
+    if not simulator.sessions.acquire(False):
+        logger.info('Refusing session, too many already open')
+        sock.close()
+        return
+    transport = paramiko.Transport(sock)
+    transport.add_server_key(host_key)
+    server = _Server(simulator)
+    try:
+        transport.start_server(server=server)
+        channel = transport.accept(20)
+        if channel is None or not server.subsystem.wait(10):
+            return
+        _session(simulator, channel)
+    except (paramiko.SSHException, socket.error, EOFError) as e:
+        logger.info('Session ended: {}'.format(e))
+    finally:
+        simulator.sessions.release()
+        transport.close()
+
+
+def serve(simulator, host='127.0.0.1', port=8830, host_key=None):
+    """
+    Starts the SSH server on a background thread
+    :return: (listening socket, port)
+    """
+    host_key = host_key or paramiko.RSAKey.generate(2048)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(NXOS_MAX_SESSIONS * 2)
+
+    def accept():
+        while True:
+            try:
+                client, address = sock.accept()
+            except socket.error:
+                return
+            thread = threading.Thread(target=_connection, args=(simulator, client, host_key))
+            thread.daemon = True
+            thread.start()
+
+    thread = threading.Thread(target=accept, name='netconf-simulator')
+    thread.daemon = True
+    thread.start()
+    return sock, sock.getsockname()[1]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Simulated NX-OS NETCONF server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8830)
+    parser.add_argument('--rows', type=int, default=1000, help='vlans, SVIs and HSRP groups in the replies')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every RPC')
+    parser.add_argument('--username')
+    parser.add_argument('--password')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    simulator = NexusSimulator(fixtures.nexus_replies(args.rows), latency=args.latency,
+                               username=args.username, password=args.password)
+    sock, port = serve(simulator, args.host, args.port)
+    print 'NETCONF simulator listening on {}:{}'.format(args.host, port)
+    try:
+        while True:
+            time.sleep(60)
+            print '{} RPCs, {} edit_configs recorded'.format(simulator.rpcs, len(simulator.edits))
+    except KeyboardInterrupt:
+        sock.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+import unittest
+from acimigrate.reconcile import ApicState, parent_of
+
+PATH = 'rspathAtt-[topology/pod-1/protpaths-101-102/pathep-[legacy-nexus-vpc]]'
+
+
+class StaleTest(unittest.TestCase):
+
+    def test_parent_of_bracketed_rn(self):
+        self.assertEqual(parent_of('uni/tn-a/BD-b/subnet-[10.0.0.1/24]'), 'uni/tn-a/BD-b')
+        self.assertEqual(parent_of('uni/tn-a/ap-b/epg-c/' + PATH), 'uni/tn-a/ap-b/epg-c')
+        self.assertEqual(parent_of('uni'), '')
+
+    def test_stale_children_with_slashes_in_their_rn(self):
+        state = ApicState({'uni/tn-a/ap-b/epg-old': ('fvAEPg', {}),
+                           'uni/tn-a/ap-b/epg-c': ('fvAEPg', {}),
+                           'uni/tn-a/ap-b/epg-c/' + PATH: ('fvRsPathAtt', {}),
+                           'uni/tn-a/BD-b/subnet-[10.0.0.1/24]': ('fvSubnet', {}),
+                           'uni/tn-a/BD-b/subnet-[10.0.1.1/24]': ('fvSubnet', {})})
+        seen = set(['uni/tn-a', 'uni/tn-a/ap-b', 'uni/tn-a/ap-b/epg-c',
+                    'uni/tn-a/BD-b', 'uni/tn-a/BD-b/subnet-[10.0.1.1/24]'])
+        self.assertEqual(state.stale(seen),
+                         [('fvSubnet', 'uni/tn-a/BD-b/subnet-[10.0.0.1/24]'),
+                          ('fvRsPathAtt', 'uni/tn-a/ap-b/epg-c/' + PATH),
+                          ('fvAEPg', 'uni/tn-a/ap-b/epg-old')])
+
+
+if __name__ == '__main__':
+    unittest.main()
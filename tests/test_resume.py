@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+import os
+import shutil
+import tempfile
+import unittest
+from acimigrate import views
+from acimigrate.Devices import APIC, Nexus
+from acimigrate.journal import Journal
+from acimigrate.sessions import NetconfPool
+from benchmarks import fixtures
+from simulators import apic as apic_simulator
+from simulators import netconf as netconf_simulator
+
+ROWS = 20
+
+
+class ResumeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.fabric = apic_simulator.ApicSimulator(fixtures.fabric_nodes(2) + fixtures.l1_phys_ifs(2))
+        self.server = apic_simulator.serve(self.fabric, port=0)
+        self.apic = APIC('http://127.0.0.1:{}'.format(self.server.server_address[1]), 'admin', 'password')
+        self.listeners = []
+        self.pool = NetconfPool()
+        self.nexuses = []
+        for n in range(2):
+            switch = netconf_simulator.NexusSimulator(fixtures.nexus_replies(ROWS))
+            listener, port = netconf_simulator.serve(switch, port=0)
+            self.listeners.append(listener)
+            self.nexuses.append(Nexus('127.0.0.1', 'admin', 'password', pool=self.pool, port=port))
+        self.directory = tempfile.mkdtemp()
+        self.journal, views.journal = views.journal, Journal(os.path.join(self.directory, 'journal.db'))
+
+    def tearDown(self):
+        views.journal = self.journal
+        shutil.rmtree(self.directory)
+        self.pool.close()
+        for listener in self.listeners:
+            listener.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def migrate(self, **kwargs):
+        interfaces = dict((fixtures.leaf_name(n), [['eth1/1'], ['eth1/2']]) for n in range(2))
+        nx, nx2 = self.nexuses
+        return views.run_migration(nx, self.apic, nx2, 'tenant', 'app',
+                                   progress=lambda *args: None,
+                                   n1_int_list=['Ethernet1/1', 'Ethernet1/2'],
+                                   n2_int_list=['Ethernet1/1', 'Ethernet1/2'],
+                                   aci_interface_dict=interfaces,
+                                   **kwargs)
+
+    def epgs(self):
+        return [dn for dn, (cls, attrs) in self.fabric.objects.items() if cls == 'fvAEPg']
+
+    def test_resume_with_delete_stale_keeps_committed_epgs(self):
+        nx2 = self.nexuses[1]
+
+        def fail(int_list, pc):
+            raise RuntimeError('vpc step failed')
+        nx2.config_phy_connection = fail
+        with self.assertRaises(RuntimeError):
+            self.migrate()
+        self.assertEqual(len(self.epgs()), ROWS)
+
+        del nx2.config_phy_connection
+        result = self.migrate(delete_stale=True)
+        self.assertEqual(result['deleted'], [])
+        self.assertEqual(len(self.epgs()), ROWS)
+
+
+if __name__ == '__main__':
+    unittest.main()
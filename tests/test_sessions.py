@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+import threading
+import unittest
+from acimigrate.Devices import APIC
+from acimigrate.sessions import APIC_HTTP_POOL_SIZE, ApicLoginError, NetconfPool, apic_sessions, credential_key
+from benchmarks import fixtures
+from simulators import apic as apic_simulator
+
+
+class ApicSessionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.simulator = apic_simulator.ApicSimulator(fixtures.fabric_nodes(2) + fixtures.l1_phys_ifs(2))
+        self.server = apic_simulator.serve(self.simulator, port=0)
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_address[1])
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def pool_size(self, session):
+        return session.session.session.get_adapter(self.url)._pool_maxsize
+
+    def test_construct_and_query(self):
+        apic = APIC(self.url, 'admin', 'password')
+        self.assertEqual(apic.session.token_lifetime, apic_simulator.APIC_TOKEN_LIFETIME)
+        self.assertEqual(self.pool_size(apic.session), APIC_HTTP_POOL_SIZE)
+        self.assertEqual(sorted(apic.list_leaves()), [fixtures.leaf_name(0), fixtures.leaf_name(1)])
+
+    def test_expired_token_logs_in_again_and_keeps_pool(self):
+        session = APIC(self.url, 'admin', 'password').session
+        before = session.session.session
+        self.simulator.tokens.clear()
+        resp = session.get('/api/node/class/fabricNode.json')
+        self.assertEqual(resp.status_code, 200)
+        self.assertIsNot(session.session.session, before)
+        self.assertEqual(self.pool_size(session), APIC_HTTP_POOL_SIZE)
+
+    def test_stale_token_is_refreshed(self):
+        session = APIC(self.url, 'admin', 'password').session
+        session.logged_in -= session.token_lifetime
+        before = session.session.token
+        resp = session.get('/api/node/class/fabricNode.json')
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(session.session.token, before)
+        self.assertTrue(session.session.login_thread.is_alive())
+
+    def test_rejected_login_is_not_kept(self):
+        self.simulator.login = lambda body: (None, apic_simulator.error(401, 'Authentication failed'))
+        with self.assertRaises(ApicLoginError):
+            APIC(self.url, 'admin', 'wrong')
+        del self.simulator.login
+        session = APIC(self.url, 'admin', 'wrong').session
+        self.assertTrue(session.session.logged_in())
+
+    def test_discard_stops_login_thread(self):
+        session = APIC(self.url, 'admin', 'password').session
+        apic_sessions.discard(self.url, 'admin', 'password')
+        self.assertTrue(session.session.login_thread._exit)
+        self.assertFalse(session.session.logged_in())
+        self.assertIsNot(APIC(self.url, 'admin', 'password').session, session)
+
+
+class FakeManager(object):
+    connected = True
+
+    def close_session(self):
+        self.connected = False
+
+
+class NetconfPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = NetconfPool(max_sessions=1)
+        self.opened = []
+
+    def tearDown(self):
+        self.pool.close()
+
+    def connect(self):
+        self.opened.append(FakeManager())
+        return self.opened[-1]
+
+    def test_session_limit_covers_every_credential(self):
+        admin = credential_key('nexus', 830, 'admin', 'password')
+        other = credential_key('nexus', 830, 'other', 'password')
+        borrowed = threading.Event()
+
+        def borrow():
+            with self.pool.session(other, self.connect):
+                borrowed.set()
+        with self.pool.session(admin, self.connect):
+            thread = threading.Thread(target=borrow)
+            thread.start()
+            self.assertFalse(borrowed.wait(0.2))
+        thread.join(5)
+        self.assertTrue(borrowed.is_set())
+        # idle sessions are only reused with the credentials they opened with
+        self.assertEqual(len(self.opened), 2)
+        with self.pool.session(admin, self.connect):
+            pass
+        self.assertEqual(len(self.opened), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()